@@ -1,45 +1,1092 @@
 # app.py
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Blueprint, current_app, g, request, jsonify, render_template_string, Response
+import numpy as np
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BlipProcessor, BlipForConditionalGeneration
+from transformers import AutoModelForCausalLM, AutoTokenizer, BlipProcessor, BlipForConditionalGeneration, \
+    DynamicCache, TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
 from peft import PeftModel
 from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
 import whisper
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import base64
+import binascii
+import contextvars
+import functools
+import gc
+import hashlib
 import io
+import json
+import math
 import os
+import queue
+import re
+import selectors
+import socket
+import sqlite3
+import ssl
+import subprocess
+import threading
 import time
+import uuid
 
-app = Flask(__name__)
+BASE_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+ADAPTER_DIR = "models/agro-expert"
+DEFAULT_ADAPTER = "agro-expert"
+# More LoRA adapters served on the same resident base model, as "name=path,name=path"
+ADAPTERS = {DEFAULT_ADAPTER: ADAPTER_DIR}
+for entry in filter(None, os.environ.get("AGRO_ADAPTERS", "").split(",")):
+    name, _, path = entry.partition("=")
+    ADAPTERS[name.strip()] = path.strip()
+# Adapters beyond this many are unloaded, least recently used first
+MAX_LOADED_ADAPTERS = int(os.environ.get("AGRO_MAX_LOADED_ADAPTERS", 4))
+# Checkpoint written by merge_adapter.py; when set it replaces base model + adapter
+MERGED_MODEL_DIR = os.environ.get("AGRO_MERGED_MODEL")
 
-# Create folders
-os.makedirs("uploads/images", exist_ok=True)
-os.makedirs("uploads/audio", exist_ok=True)
+# "text" serves /analyze, "image" adds BLIP captioning, "voice" serves /transcribe
+MODALITIES = ("text", "image", "voice")
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
-print("Loading models...")
 
-# Load models
-base_model = AutoModelForCausalLM.from_pretrained(
-    "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-).to(device)
+# "int8" swaps the Linear layers of every model for dynamically quantized ones (CPU only)
+QUANTIZE = os.environ.get("AGRO_QUANTIZE") or None
+if QUANTIZE not in (None, "int8"):
+    raise ValueError(f"Unknown AGRO_QUANTIZE mode: {QUANTIZE}")
+if QUANTIZE and device == "cuda":
+    print("AGRO_QUANTIZE only applies to CPU inference, ignoring it on CUDA")
+    QUANTIZE = None
+if (MERGED_MODEL_DIR or QUANTIZE) and len(ADAPTERS) > 1:
+    # Both bake agro-expert into the base weights, leaving no base model to attach other adapters to
+    print(f"AGRO_ADAPTERS needs the unmerged, unquantized base model; serving only {DEFAULT_ADAPTER}")
+    ADAPTERS = {DEFAULT_ADAPTER: ADAPTER_DIR}
 
-model = PeftModel.from_pretrained(base_model, "models/agro-expert").to(device)
-model.eval()
 
-tokenizer = AutoTokenizer.from_pretrained("TinyLlama/TinyLlama-1.1B-Chat-v1.0")
-tokenizer.pad_token = tokenizer.eos_token
+def tensor_bytes(value):
+    """Bytes held by the tensors in a model, a tensor, or a tuple/list of either"""
+    if isinstance(value, torch.nn.Module):
+        # Dynamically quantized layers keep their weights in packed (weight, bias) tuples outside parameters()
+        value = list(value.state_dict().values())
+    if torch.is_tensor(value):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(tensor_bytes(item) for item in value)
+    return 0
 
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-blip_model = BlipForConditionalGeneration.from_pretrained(
-    "Salesforce/blip-image-captioning-base",
-    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-).to(device)
 
-whisper_model = whisper.load_model("base")
+class LazyModel:
+    """Loads a model the first time it is needed and keeps it for the life of the process"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._value = None
+        self._nbytes = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    print(f"Loading {self.name}...")
+                    started = time.time()
+                    self._value = self.loader()
+                    print(f"✓ {self.name} ready in {time.time() - started:.1f}s")
+        return self._value
+
+    def warm_up(self):
+        """Loads the model on a background thread so the first request does not pay for it"""
+        thread = threading.Thread(target=self.get, name=f"warm-up {self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def nbytes(self):
+        """Memory held by the loaded model's tensors, 0 until it is loaded"""
+        if self._value is None:
+            return 0
+        if self._nbytes is None:
+            self._nbytes = tensor_bytes(self._value)
+        return self._nbytes
+
+
+def quantize_int8(model):
+    """Replaces the model's Linear layers, in place, with ones holding int8 weights.
+
+    Activations are quantized on the fly per batch, so no calibration data is
+    needed. Weights take a quarter of their fp32 size and the matmuls run on
+    the int8 kernels of fbgemm/qnnpack.
+    """
+    for module in model.modules():
+        # Whisper's Linear only adds a cast to the input dtype, which fp32 inference does not need
+        if type(module) is whisper.model.Linear:
+            module.__class__ = torch.nn.Linear
+    # In place, so the fp32 and int8 copies never sit in memory together
+    return torch.ao.quantization.quantize_dynamic(model.float(), {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_llm():
+    if MERGED_MODEL_DIR:
+        print(f"Using merged checkpoint {MERGED_MODEL_DIR}")
+        # Safetensors are memory-mapped; keeping the stored dtype avoids copying the weights on load
+        model = AutoModelForCausalLM.from_pretrained(
+            MERGED_MODEL_DIR,
+            torch_dtype="auto",
+            low_cpu_mem_usage=True,
+        ).to(device)
+    else:
+        base_model = AutoModelForCausalLM.from_pretrained(
+            BASE_MODEL,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+        ).to(device)
+
+        model = PeftModel.from_pretrained(base_model, ADAPTER_DIR, adapter_name=DEFAULT_ADAPTER).to(device)
+        if QUANTIZE:
+            # Quantized layers cannot carry a LoRA delta, so bake it into the weights first
+            model = model.merge_and_unload()
+    if QUANTIZE:
+        model = quantize_int8(model)
+    model.eval()
+
+    tokenizer = AutoTokenizer.from_pretrained(MERGED_MODEL_DIR or BASE_MODEL)
+    tokenizer.pad_token = tokenizer.eos_token
+    # Batched prompts are padded on the left so every row ends right before its first new token
+    tokenizer.padding_side = "left"
+    return model, tokenizer
+
+
+class AdapterPool:
+    """LoRA adapters sharing the one resident base model, loaded from disk when first requested.
+
+    At most ``max_loaded`` stay loaded; the least recently used one (never the
+    default, nor one the current batch needs) is unloaded to make room. All
+    methods expect ``model_lock`` to be held.
+    """
+
+    def __init__(self, paths, default, max_loaded):
+        self.paths = paths
+        self.default = default
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict([(default, True)])
+
+    def activate(self, model, names):
+        """Loads the adapters ``names`` needs and returns the generate() kwargs routing each row to its own"""
+        if not isinstance(model, PeftModel):
+            return {}
+
+        needed = set(names)
+        for name in needed:
+            if name not in self._loaded:
+                print(f"Loading adapter {name} from {self.paths[name]}...")
+                model.load_adapter(self.paths[name], adapter_name=name)
+            self._loaded[name] = True
+            self._loaded.move_to_end(name)
+
+        while len(self._loaded) > self.max_loaded:
+            victim = next((name for name in self._loaded if name not in needed and name != self.default), None)
+            if victim is None:
+                break
+            print(f"Unloading adapter {victim}")
+            model.delete_adapter(victim)
+            del self._loaded[victim]
+            with prefix_caches_lock:
+                prefix_caches.pop(victim, None)
+
+        if len(needed) == 1:
+            # One adapter for the whole batch runs the plain LoRA forward, without per-row routing
+            model.set_adapter(names[0])
+            return {}
+        return {"adapter_names": list(names)}
+
+    def loaded(self):
+        return list(self._loaded)
+
+
+def load_draft():
+    """Small causal LM sharing TinyLlama's tokenizer, used to draft tokens for the main model"""
+    draft_model = AutoModelForCausalLM.from_pretrained(
+        ASSISTED_DECODING,
+        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+    ).to(device)
+    if QUANTIZE:
+        draft_model = quantize_int8(draft_model)
+    return draft_model.eval()
+
+
+def load_blip():
+    blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
+    blip_model = BlipForConditionalGeneration.from_pretrained(
+        "Salesforce/blip-image-captioning-base",
+        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+    ).to(device)
+    if QUANTIZE:
+        blip_model = quantize_int8(blip_model)
+    return blip_processor, blip_model
+
+
+def load_whisper():
+    whisper_model = whisper.load_model("base", device=device)
+    return quantize_int8(whisper_model) if QUANTIZE else whisper_model
+
+
+# Whisper installs per-call hooks on the shared model, so transcriptions must not overlap
+asr_lock = threading.Lock()
+
+
+llm = LazyModel("TinyLlama + agro-expert", load_llm)
+adapter_pool = AdapterPool(ADAPTERS, DEFAULT_ADAPTER, MAX_LOADED_ADAPTERS)
+draft = LazyModel("draft model", load_draft)
+blip = LazyModel("BLIP", load_blip)
+asr = LazyModel("Whisper", load_whisper)
+
+# Which lazy model backs each modality
+MODALITY_MODELS = {"text": llm, "image": blip, "voice": asr}
+
+SYSTEM_PROMPT = "You are an expert agricultural advisor for Indian farmers. Give practical, safe advice in simple language."
+
+# Every prompt starts with this, so its key/value cache is computed once and shared by all generations
+PROMPT_PREFIX = f"""<|system|>
+{SYSTEM_PROMPT}</s>
+<|user|>
+"""
+PREFIX_CACHE = os.environ.get("AGRO_PREFIX_CACHE", "1") == "1"
+
+# Greedy decoding makes the advice for a given context reproducible, which is what lets it be cached
+DETERMINISTIC = os.environ.get("AGRO_DETERMINISTIC") == "1"
+
+if DETERMINISTIC:
+    GENERATION_KWARGS = dict(max_new_tokens=500, do_sample=False, repetition_penalty=1.2)
+else:
+    GENERATION_KWARGS = dict(max_new_tokens=500, temperature=0.7, do_sample=True, repetition_penalty=1.2)
+
+# Token budget per request type, as "type=tokens,...": typed questions ("text"), photos ("image")
+# and voice notes ("voice"). Most answers end well before the 500 token ceiling; the budget cuts off
+# the runaway ones. Rows also stop at the chat end token, at the start of a new chat turn, and once
+# their last REPEAT_NGRAM tokens have already appeared REPEAT_LIMIT times in the answer.
+TOKEN_BUDGETS = {"text": 256, "image": 384, "voice": 256}
+for entry in filter(None, os.environ.get("AGRO_TOKEN_BUDGETS", "").split(",")):
+    kind, _, tokens = entry.partition("=")
+    TOKEN_BUDGETS[kind.strip()] = int(tokens)
+TURN_MARKERS = ["<|user|>", "<|system|>", "<|assistant|>"]
+REPEAT_NGRAM = int(os.environ.get("AGRO_REPEAT_NGRAM", 10))
+REPEAT_LIMIT = int(os.environ.get("AGRO_REPEAT_LIMIT", 2))
+
+# Assisted decoding: "prompt" drafts tokens by n-gram lookup in the prompt (curated references, the
+# caption), a model path or hub id drafts with that smaller model instead. The main model verifies
+# every drafted token, so the output is the same as without drafting.
+ASSISTED_DECODING = os.environ.get("AGRO_ASSISTED_DECODING") or None
+PROMPT_LOOKUP_TOKENS = int(os.environ.get("AGRO_PROMPT_LOOKUP_TOKENS", 10))
+
+ADVICE_CACHE_SIZE = int(os.environ.get("AGRO_ADVICE_CACHE_SIZE", 256))
+ADVICE_CACHE_TTL = float(os.environ.get("AGRO_ADVICE_CACHE_TTL", 24 * 3600))
+ADVICE_CACHE_PATH = os.environ.get("AGRO_ADVICE_CACHE_PATH")
+
+# Curated Q&A corpus searched before generating: near-verbatim questions get the curated answer
+# outright, weaker matches are passed to the LLM as reference material. On the bundled corpus,
+# rewordings of its questions score 0.76-1.0 and a curated question with an unrelated one tacked
+# on scores at most 0.72, so 0.75 separates the two.
+RETRIEVAL = os.environ.get("AGRO_RETRIEVAL", "1") == "1"
+CORPUS_PATH = os.environ.get("AGRO_CORPUS", "data/agro_train.jsonl")
+RETRIEVAL_ANSWER_THRESHOLD = float(os.environ.get("AGRO_RETRIEVAL_ANSWER_THRESHOLD", 0.75))
+RETRIEVAL_CONTEXT_THRESHOLD = float(os.environ.get("AGRO_RETRIEVAL_CONTEXT_THRESHOLD", 0.3))
+RETRIEVAL_TOP_K = int(os.environ.get("AGRO_RETRIEVAL_TOP_K", 1))
+# Reference answers are cut to this many characters so the farmer's text still fits in 512 tokens
+GROUNDING_CHARS = int(os.environ.get("AGRO_GROUNDING_CHARS", 600))
+
+# Adds a Server-Timing header (and timings in the final stream event) to every response, not
+# just those asking for it with ?debug=1 or X-Agro-Debug: 1
+DEBUG_TIMINGS = os.environ.get("AGRO_DEBUG_TIMINGS") == "1"
+
+CAPTION_CACHE_SIZE = int(os.environ.get("AGRO_CAPTION_CACHE_SIZE", 512))
+CAPTION_BATCH_SIZE = int(os.environ.get("AGRO_CAPTION_BATCH_SIZE", 8))
+CAPTION_PROMPT = "a photo of a plant with"
+
+# Uploads are rejected as soon as they grow past these limits, before they are fully read
+MAX_REQUEST_BYTES = int(float(os.environ.get("AGRO_MAX_REQUEST_MB", 16)) * 1024 * 1024)
+MAX_IMAGE_BYTES = int(float(os.environ.get("AGRO_MAX_IMAGE_MB", 10)) * 1024 * 1024)
+MAX_AUDIO_BYTES = int(float(os.environ.get("AGRO_MAX_AUDIO_MB", 10)) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+MAX_BATCH_SIZE = int(os.environ.get("AGRO_MAX_BATCH_SIZE", 8))
+MAX_BATCH_WAIT = float(os.environ.get("AGRO_MAX_BATCH_WAIT_MS", 50)) / 1000
+
+# Jobs submitted to /jobs wait in a bounded queue in JOB_DB_PATH, shared by every process on the
+# machine, for one of the JOB_WORKERS inference threads each web process runs. Set it to 0 to keep
+# the web processes light and drain the queue with job_worker.py processes instead.
+JOB_DB_PATH = os.environ.get("AGRO_JOB_DB", "data/agro_jobs.db")
+JOB_WORKERS = int(os.environ.get("AGRO_JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = 0.25
+JOB_QUEUE_SIZE = int(os.environ.get("AGRO_JOB_QUEUE_SIZE", 64))
+JOB_TTL = float(os.environ.get("AGRO_JOB_TTL", 3600))
+# A running job whose process has exited, or that has run longer than JOB_CLAIM_TIMEOUT seconds, is
+# put back in the queue; one that has been claimed JOB_MAX_ATTEMPTS times is failed instead
+JOB_CLAIM_TIMEOUT = float(os.environ.get("AGRO_JOB_CLAIM_TIMEOUT", 900))
+JOB_MAX_ATTEMPTS = 2
+MAX_JOB_WAIT = float(os.environ.get("AGRO_MAX_JOB_WAIT", 30))
+
+# At most MAX_ACTIVE_REQUESTS requests work on the models at once; up to MAX_QUEUED_REQUESTS more
+# wait up to ADMISSION_WAIT seconds for a turn, and anything beyond that is turned away with a 503.
+# These bound each process. The server must hand it more concurrent requests than their sum for
+# a 503 to ever be sent; gunicorn.conf.py sizes its worker threads from them for that reason.
+MAX_ACTIVE_REQUESTS = int(os.environ.get("AGRO_MAX_ACTIVE_REQUESTS", 2 * MAX_BATCH_SIZE))
+MAX_QUEUED_REQUESTS = int(os.environ.get("AGRO_MAX_QUEUED_REQUESTS", 32))
+ADMISSION_WAIT = float(os.environ.get("AGRO_ADMISSION_WAIT", 10))
+
+# Requests are given up on (504) after this many seconds; clients may ask for less with X-Agro-Timeout.
+# Generation for a request stops at its deadline, or as soon as its client disconnects.
+REQUEST_TIMEOUT = float(os.environ.get("AGRO_REQUEST_TIMEOUT", 120))
+DISCONNECT_POLL_INTERVAL = 0.25
+
+# torch intra-op threads for each stage's work (unset uses the process default), so the caption,
+# transcription and generation stages can run side by side without oversubscribing cores
+LLM_THREADS = int(os.environ.get("AGRO_LLM_THREADS", 0)) or None
+CAPTION_THREADS = int(os.environ.get("AGRO_CAPTION_THREADS", 0)) or None
+ASR_THREADS = int(os.environ.get("AGRO_ASR_THREADS", 0)) or None
+ASR_WORKERS = int(os.environ.get("AGRO_ASR_WORKERS", 2))
+
+# Silence is cut out of recordings before Whisper sees them: frames quieter than VAD_MARGIN_DB
+# above the noise floor count as silence, the floor being measured over the first and last
+# VAD_EDGE_MS. The threshold stays between VAD_MIN_DB and VAD_MAX_DB absolute, so a recording
+# that is speech end to end cannot push it up past quiet words. Speech keeps VAD_PAD_MS of
+# context on each side, and only pauses of at least VAD_MIN_PAUSE_MS are cut at all
+VAD = os.environ.get("AGRO_VAD", "1") == "1"
+VAD_FRAME_MS = 30
+VAD_EDGE_MS = int(os.environ.get("AGRO_VAD_EDGE_MS", 300))
+VAD_PAD_MS = int(os.environ.get("AGRO_VAD_PAD_MS", 200))
+VAD_MIN_PAUSE_MS = int(os.environ.get("AGRO_VAD_MIN_PAUSE_MS", 1000))
+VAD_MARGIN_DB = float(os.environ.get("AGRO_VAD_MARGIN_DB", 10))
+VAD_MIN_DB = float(os.environ.get("AGRO_VAD_MIN_DB", -50))
+VAD_MAX_DB = float(os.environ.get("AGRO_VAD_MAX_DB", -40))
+
+# The startup warm-up asks the LLM this, for a few tokens only
+WARM_UP_QUESTION = "My tomato leaves have yellow spots. What should I do?"
+WARM_UP_TOKENS = 8
+
+# Load every model in the master process before gunicorn forks, so workers share the weights
+PRELOAD = os.environ.get("AGRO_PRELOAD") == "1"
+
+# Only one generate() call runs on the shared model at a time
+model_lock = threading.Lock()
+
+
+class Metrics:
+    """Process-wide counters and histograms, rendered in the Prometheus text format"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            # Cumulative bucket counts, then the observation count and sum
+            hist = self._histograms.setdefault(key, [0] * len(self.BUCKETS) + [0, 0.0])
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += value
+
+    def render(self, gauges=()):
+        """``gauges`` are (name, labels, value) read at scrape time"""
+        def series(name, labels, value):
+            pairs = ",".join(f'{k}="{v}"' for k, v in labels)
+            return f"{name}{{{pairs}}} {value}" if pairs else f"{name} {value}"
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                declare(name, "counter")
+                lines.append(series(name, labels, value))
+            for (name, labels), hist in sorted(self._histograms.items()):
+                declare(name, "histogram")
+                for bound, count in zip(self.BUCKETS, hist):
+                    lines.append(series(f"{name}_bucket", labels + (("le", bound),), count))
+                lines.append(series(f"{name}_bucket", labels + (("le", "+Inf"),), hist[-2]))
+                lines.append(series(f"{name}_count", labels, hist[-2]))
+                lines.append(series(f"{name}_sum", labels, hist[-1]))
+        for name, labels, value in gauges:
+            declare(name, "gauge")
+            lines.append(series(name, self._key(name, labels)[1], value))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# Timing dicts of the request(s) the current thread is working for; a batch serves several at once
+_traces = contextvars.ContextVar("agro_traces", default=())
+
+
+def record_stage(name, seconds, traces=None):
+    metrics.observe("agro_stage_seconds", seconds, stage=name)
+    for trace in _traces.get() if traces is None else traces:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Times a block as one pipeline stage, both in /metrics and in the timings of the requests it serves"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def in_stage(name, fn, *args):
+    with stage(name):
+        return fn(*args)
+
+
+def resident_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# Intra-op threads for work no stage pins; configure_worker() lowers it for each gunicorn worker
+default_torch_threads = torch.get_num_threads()
+
+
+def pin_torch_threads(num_threads=None):
+    """Sets the calling thread's torch intra-op thread count, ``default_torch_threads`` when None.
+
+    torch.set_num_threads() also changes the process-wide count, which every
+    thread adopts at its first parallel op, overriding whatever it pinned
+    before. So stages pin right before each unit of work, not once per thread.
+    """
+    torch.set_num_threads(num_threads or default_torch_threads)
+
+
+class AudioDecodeError(ValueError):
+    """The upload is not audio ffmpeg can decode"""
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time or its client disconnected, so its work was abandoned"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def client_gone(sock):
+    """True once the client has closed its end of the connection.
+
+    A socket that cannot be polled is not taken for a disconnect; the
+    request then just runs until its deadline.
+    """
+    try:
+        # selectors, unlike select.select(), handles descriptors past FD_SETSIZE (1024)
+        with selectors.DefaultSelector() as selector:
+            selector.register(sock, selectors.EVENT_READ)
+            readable = selector.select(0)
+    except (OSError, ValueError, KeyError):
+        return False
+    if not readable:
+        return False
+    try:
+        # The request body has been read, so a readable socket is either EOF or a pipelined request
+        return not sock.recv(1, socket.MSG_PEEK)
+    except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError):
+        return True
+    except OSError:
+        return False
+
+
+class Deadline:
+    """When a request stops being worth working on: its time is up or its client hung up"""
+
+    def __init__(self, seconds, sock=None):
+        self.at = time.monotonic() + seconds
+        # TLS sockets cannot be peeked at, so disconnects are only noticed on plain connections
+        self.socket = None if sock is None or isinstance(sock, ssl.SSLSocket) else sock
+        self.reason = None
+        self._polled = 0.0
+
+    def remaining(self):
+        return max(0.0, self.at - time.monotonic())
+
+    def expired(self):
+        if self.reason is None:
+            now = time.monotonic()
+            if now >= self.at:
+                self.reason = "timeout"
+            elif self.socket is not None and now - self._polled >= DISCONNECT_POLL_INTERVAL:
+                self._polled = now
+                if client_gone(self.socket):
+                    self.reason = "disconnected"
+        return self.reason is not None
+
+    def cancel(self, reason="disconnected"):
+        if self.reason is None:
+            self.reason = reason
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded(self.reason)
+
+    def wait(self, future):
+        """The future's result, unless the request expires first; a future that has not started is cancelled"""
+        while not self.expired():
+            try:
+                return future.result(timeout=min(self.remaining(), DISCONNECT_POLL_INTERVAL))
+            except FutureTimeoutError:
+                pass
+        future.cancel()
+        raise DeadlineExceeded(self.reason)
+
+
+# Deadline of the request the current thread is working for, and inside a batch one per item
+_deadline = contextvars.ContextVar("agro_deadline", default=None)
+_batch_deadlines = contextvars.ContextVar("agro_batch_deadlines", default=())
+
+
+class AdmissionControl:
+    """Caps the requests working on the models at once, with a short bounded queue in front.
+
+    A request that finds the queue full, or does not get a turn within
+    ``max_wait`` seconds, is shed instead of adding to everyone's latency.
+    """
+
+    def __init__(self, max_active, max_queued, max_wait):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        # Moving average of how long an admitted request holds its turn, for Retry-After
+        self._seconds = 1.0
+
+    def enter(self, max_wait=None):
+        """True once the request may go ahead, False when it should be turned away"""
+        with self._cond:
+            if self._active >= self.max_active:
+                if self._waiting >= self.max_queued:
+                    return False
+                self._waiting += 1
+                try:
+                    wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+                    if not self._cond.wait_for(lambda: self._active < self.max_active, wait):
+                        return False
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+            return True
+
+    def leave(self, seconds):
+        with self._cond:
+            self._active -= 1
+            self._seconds = 0.8 * self._seconds + 0.2 * seconds
+            self._cond.notify()
+
+    def retry_after(self):
+        """Seconds until a turn is likely to free up: the queue ahead shared among the active slots"""
+        with self._cond:
+            return max(1, math.ceil(self._seconds * (self._waiting + 1) / self.max_active))
+
+    def stats(self):
+        with self._cond:
+            return {"active": self._active, "waiting": self._waiting}
+
+
+admission = AdmissionControl(MAX_ACTIVE_REQUESTS, MAX_QUEUED_REQUESTS, ADMISSION_WAIT)
+
+
+class BatchScheduler:
+    """Collects submitted items into batches and runs them on a single worker thread.
+
+    A batch is dispatched once it holds ``max_batch_size`` items or ``max_wait``
+    seconds have passed since its first item arrived. ``run_batch`` takes a list
+    of items and returns one result per item, in order, and can find each
+    item's request deadline in ``_batch_deadlines``. Items whose request
+    expired while queued are dropped unrun. ``torch_threads`` pins the
+    worker's torch intra-op thread count.
+    """
+
+    def __init__(self, run_batch, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT, name="batch-scheduler",
+                 torch_threads=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.torch_threads = torch_threads
+        self._lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        self._pid = None
+
+    def submit(self, item):
+        future = Future()
+        self._ensure_worker().put((item, future, _traces.get(), _deadline.get(), time.perf_counter()))
+        return future
+
+    def _ensure_worker(self):
+        with self._lock:
+            # Threads do not survive a fork, so each worker process starts its own
+            if self._worker is None or not self._worker.is_alive() or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._loop, args=(self._queue,), name=self.name, daemon=True)
+                self._worker.start()
+            return self._queue
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self, pending):
+        while True:
+            batch = []
+            for entry in self._collect(pending):
+                item, future, _, deadline, _ = entry
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if deadline is not None and deadline.expired():
+                    future.set_exception(DeadlineExceeded(deadline.reason))
+                    continue
+                batch.append(entry)
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            for _, _, traces, _, submitted in batch:
+                metrics.observe("agro_queue_wait_seconds", started - submitted, queue=self.name)
+                for trace in traces:
+                    trace[f"{self.name}_wait"] = started - submitted
+            metrics.inc("agro_batches_total", queue=self.name)
+            metrics.inc("agro_batched_items_total", len(batch), queue=self.name)
+
+            pin_torch_threads(self.torch_threads)
+            # Stages timed inside run_batch count towards every request in the batch
+            token = _traces.set(tuple(trace for _, _, traces, _, _ in batch for trace in traces))
+            deadlines_token = _batch_deadlines.set(tuple(deadline for _, _, _, deadline, _ in batch))
+            try:
+                results = self.run_batch([item for item, _, _, _, _ in batch])
+            except Exception as e:
+                for _, future, _, _, _ in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                _traces.reset(token)
+                _batch_deadlines.reset(deadlines_token)
+
+            for (_, future, _, _, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with an optional TTL and hit/miss counters.
+
+    With ``path`` set, entries are also written to a SQLite file so they
+    survive restarts; values must then be JSON serializable.
+    """
+
+    def __init__(self, max_entries=256, ttl=None, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._path = path
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        # A SQLite connection must not cross a fork, so each worker process opens its own
+        if self._path and self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, created REAL)")
+            self._conn.commit()
+        return self._conn
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+
+            if entry is None or self._expired(entry[1]):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        entry = (value, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, json.dumps(value), entry[1]))
+                # Keep the file as bounded as the memory tier
+                self._db.execute("DELETE FROM cache WHERE key NOT IN "
+                                 "(SELECT key FROM cache ORDER BY created DESC LIMIT ?)", (self.max_entries,))
+                self._db.commit()
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class QAIndex:
+    """TF-IDF index over the curated questions, kept as one L2-normalized NumPy matrix.
+
+    Terms are lowercase words and word bigrams, so "yellow spots" counts for
+    more than "yellow" and "spots" apart. Function words are left out, so a
+    score reflects the crop and symptom words two questions share.
+    ``search`` returns up to ``k`` (cosine score, question, answer) tuples,
+    best first.
+    """
+
+    STOPWORDS = frozenset(
+        "a an and are at be by can could do does for from has have how i in is it its me my of on or our should so "
+        "the their them there these they this those to use was we were what when where which why will with would "
+        "you your".split())
+
+    def __init__(self, pairs):
+        self.questions = [question for question, _ in pairs]
+        self.answers = [answer for _, answer in pairs]
+        docs = [self.terms(question) for question in self.questions]
+
+        self.vocab = {}
+        for doc in docs:
+            for term in doc:
+                self.vocab.setdefault(term, len(self.vocab))
+
+        counts = np.zeros((len(docs), len(self.vocab)), dtype=np.float32)
+        for row, doc in enumerate(docs):
+            for term in doc:
+                counts[row, self.vocab[term]] += 1
+
+        df = (counts > 0).sum(axis=0)
+        self.idf = (np.log((1 + len(docs)) / (1 + df)) + 1).astype(np.float32)
+        self.matrix = self._normalize(counts * self.idf)
+
+    @classmethod
+    def terms(cls, text):
+        words = [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in cls.STOPWORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    @staticmethod
+    def _normalize(rows):
+        norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+        return rows / np.maximum(norms, 1e-12)
+
+    def search(self, text, k=1):
+        vec = np.zeros(len(self.vocab), dtype=np.float32)
+        unknown = {}
+        for term in self.terms(text):
+            column = self.vocab.get(term)
+            if column is not None:
+                vec[column] += 1
+            else:
+                unknown[term] = unknown.get(term, 0) + 1
+        if not vec.any():
+            return []
+
+        # Terms no curated question uses still count towards the query's length, at the idf of a term
+        # seen in no document, so extra unrelated text lowers the score instead of being ignored
+        weights = vec * self.idf
+        unseen = np.float32(np.log(1 + len(self.questions)) + 1) * np.array(list(unknown.values()), dtype=np.float32)
+        norm = np.sqrt(np.dot(weights, weights) + np.dot(unseen, unseen))
+        scores = self.matrix @ weights / max(norm, 1e-12)
+        best = np.argsort(-scores)[:k]
+        return [(float(scores[i]), self.questions[i], self.answers[i]) for i in best if scores[i] > 0]
+
+
+class Job:
+    """One /jobs request, as read back from the job database"""
+
+    def __init__(self, id, status, created, text="", adapter=DEFAULT_ADAPTER, image_bytes=None, timings=None,
+                 result=None, error=None, finished=None):
+        self.id = id
+        self.status = status
+        self.created = created
+        self.text = text
+        self.adapter = adapter
+        self.image_bytes = image_bytes
+        self.timings = timings or {}
+        self.result = result
+        self.error = error
+        self.finished = finished
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "timings": dict(self.timings),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded queue of jobs kept in a SQLite file, drained by worker threads in every process using that file.
+
+    Web workers and job_worker.py model workers share the queue and the
+    results, so a job submitted to one process can run in another and be
+    polled through any of them. ``run(job)`` does the work and returns the
+    job's result. Finished jobs are kept for ``ttl`` seconds. A job whose
+    process died while running it is requeued, or failed once it has been
+    tried ``max_attempts`` times.
+    """
+
+    COLUMNS = "id, status, created, text, adapter, image, timings, result, error, finished"
+
+    def __init__(self, run, path=JOB_DB_PATH, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, ttl=JOB_TTL,
+                 claim_timeout=JOB_CLAIM_TIMEOUT, max_attempts=JOB_MAX_ATTEMPTS, name="job-worker"):
+        self.run = run
+        self.path = path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        self.name = name
+        # Identifies the claiming process; pids are only compared between processes on the same host
+        self._host = socket.gethostname()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._threads = []
+        self._pid = None
+
+    @property
+    def _db(self):
+        # A SQLite connection must not cross a fork, so each process opens its own
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._threads = []
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Autocommit; writes that must see a consistent queue take the write lock with BEGIN IMMEDIATE
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, created REAL, "
+                               "text TEXT, adapter TEXT, image BLOB, timings TEXT, result TEXT, error TEXT, "
+                               "finished REAL, claimed REAL, claimed_by TEXT, attempts INTEGER DEFAULT 0)")
+            # Job files written before claims were recorded
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("claimed", "REAL"), ("claimed_by", "TEXT"), ("attempts", "INTEGER DEFAULT 0")):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        return self._conn
+
+    @staticmethod
+    def _job(row):
+        job_id, status, created, text, adapter, image, timings, result, error, finished = row
+        return Job(job_id, status, created, text, adapter, image, json.loads(timings or "{}"),
+                   json.loads(result) if result else None, error, finished)
+
+    def submit(self, text, image_bytes, adapter):
+        """Queues a job and returns it, raising queue.Full when the backlog is at its limit"""
+        self.start()
+        job = Job(uuid.uuid4().hex, "queued", time.time(), text, adapter, image_bytes)
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM jobs WHERE finished < ?", (time.time() - self.ttl,))
+                self._recover(db)
+                if db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0] >= self.max_queued:
+                    raise queue.Full
+                db.execute("INSERT INTO jobs (id, status, created, text, adapter, image) VALUES (?, ?, ?, ?, ?, ?)",
+                           (job.id, job.status, job.created, text, adapter, image_bytes))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def wait(self, job_id, seconds):
+        """The job once it has finished, or as it stands after ``seconds``"""
+        deadline = time.monotonic() + seconds
+        job = self.get(job_id)
+        while job is not None and job.finished is None and time.monotonic() < deadline:
+            time.sleep(min(JOB_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+            job = self.get(job_id)
+        return job
+
+    def depth(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def start(self):
+        """Starts this process's worker threads, if it has not yet; returns them"""
+        with self._lock:
+            # Threads do not survive a fork; opening this process's connection also forgets the parent's pool
+            self._db
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._loop, name=f"{self.name}-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            return self._threads
+
+    def _alive(self, claimed_by):
+        host, _, pid = (claimed_by or "").rpartition(":")
+        if host != self._host:
+            # Another host's process; only the claim timeout can tell it has gone
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except (OSError, ValueError):
+            pass
+        return True
+
+    def _recover(self, db):
+        """Requeues, or fails, running jobs whose process has exited or that are past the claim timeout.
+
+        Called inside a write transaction.
+        """
+        now = time.time()
+        for job_id, claimed, claimed_by, attempts in db.execute(
+                "SELECT id, claimed, claimed_by, attempts FROM jobs WHERE status = 'running'").fetchall():
+            if (claimed or 0) > now - self.claim_timeout and self._alive(claimed_by):
+                continue
+            if (attempts or 0) < self.max_attempts:
+                db.execute("UPDATE jobs SET status = 'queued', claimed = NULL, claimed_by = NULL WHERE id = ?",
+                           (job_id,))
+            else:
+                db.execute("UPDATE jobs SET status = 'failed', image = NULL, error = ?, finished = ? WHERE id = ?",
+                           (f"Job did not finish after {attempts} attempts", now, job_id))
+
+    def _claim(self):
+        """Marks the oldest queued job as running and returns it, None when the queue is empty"""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._recover(db)
+                row = db.execute(f"SELECT {self.COLUMNS} FROM jobs WHERE status = 'queued' "
+                                 "ORDER BY created LIMIT 1").fetchone()
+                claimed = time.time()
+                if row:
+                    db.execute("UPDATE jobs SET status = 'running', claimed = ?, claimed_by = ?, "
+                               "attempts = COALESCE(attempts, 0) + 1 WHERE id = ?",
+                               (claimed, f"{self._host}:{os.getpid()}", row[0]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        job = self._job(row)
+        job.status = "running"
+        job.claimed = claimed
+        return job
+
+    def _finish(self, job):
+        with self._lock:
+            # The upload is no longer needed once the job has run. A claim that timed out may have been
+            # requeued and taken by another worker since, in which case that worker's result stands
+            self._db.execute("UPDATE jobs SET status = ?, image = NULL, timings = ?, result = ?, error = ?, "
+                             "finished = ? WHERE id = ? AND status = 'running' AND claimed = ?",
+                             (job.status, json.dumps(job.timings), json.dumps(job.result) if job.result else None,
+                              job.error, time.time(), job.id, job.claimed))
+
+    def _loop(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            job.timings["queued"] = time.time() - job.created
+            metrics.observe("agro_queue_wait_seconds", job.timings["queued"], queue=self.name)
+            _traces.set((job.timings,))
+            try:
+                job.result = self.run(job)
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                self._finish(job)
+
+
+# Cached advice is only valid when generation is deterministic
+advice_cache = LRUCache(ADVICE_CACHE_SIZE, ADVICE_CACHE_TTL, ADVICE_CACHE_PATH) \
+    if DETERMINISTIC and ADVICE_CACHE_SIZE > 0 else None
+
+
+caption_cache = LRUCache(CAPTION_CACHE_SIZE) if CAPTION_CACHE_SIZE > 0 else None
+
+
+def normalize_text(text):
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip("?.! ")
+
+
+def advice_key(text, image_bytes, adapter=DEFAULT_ADAPTER):
+    """Identifies a request by what the model sees: the normalized text, the image content and the adapter"""
+    image_hash = hashlib.sha256(image_bytes).hexdigest() if image_bytes is not None else ""
+    return hashlib.sha256(f"{normalize_text(text)}\0{image_hash}\0{adapter}".encode()).hexdigest()
 
-print("AgroExpert Vision READY!")
 
 HTML = """
 <!DOCTYPE html>
@@ -126,6 +1173,7 @@ HTML = """
 
     <div class="content">
         <div class="grid">
+            {% if 'image' in modalities %}
             <div class="box">
                 <h3>Upload Plant Image</h3>
                 <div class="upload-area" onclick="document.getElementById('img').click()"
@@ -135,14 +1183,17 @@ HTML = """
                 </div>
                 <div id="preview"></div>
             </div>
+            {% endif %}
 
             <div class="box">
                 <h3>Describe Problem or Record Voice</h3>
                 <textarea id="text" placeholder="e.g. Tomato leaves have yellow spots and curling..."></textarea>
                 <br><br>
+                {% if 'voice' in modalities %}
                 <button onclick="startRecord()">Record Voice</button>
                 <button onclick="stopRecord()" id="stopBtn" style="display:none; background:#dc3545">Stop</button>
                 <span id="status"></span>
+                {% endif %}
 
                 <div style="margin-top:20px">
                     <strong>Quick Examples:</strong><br>
@@ -208,18 +1259,18 @@ function stopRecord() {
 }
 
 async function transcribe() {
-    const reader = new FileReader();
-    reader.onload = async () => {
-        const resp = await fetch('/transcribe', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({audio: reader.result.split(',')[1]})
-        });
-        const data = await resp.json();
-        document.getElementById('text').value = data.text;
-        document.getElementById('status').innerText = 'Transcribed!';
-    };
-    reader.readAsDataURL(audioBlob);
+    const resp = await fetch('/transcribe', {
+        method: 'POST',
+        headers: {'Content-Type': audioBlob.type || 'application/octet-stream'},
+        body: audioBlob
+    });
+    const data = await resp.json();
+    if (!resp.ok) {
+        document.getElementById('status').innerText = data.error;
+        return;
+    }
+    document.getElementById('text').value = data.text;
+    document.getElementById('status').innerText = 'Transcribed!';
 }
 
 function setText(txt) {
@@ -227,38 +1278,56 @@ function setText(txt) {
 }
 
 async function analyze() {
-    const text = document.getElementById('text').value;
-    let image = null;
-    if (imageFile) {
-        const reader = new FileReader();
-        image = await new Promise(resolve => {
-            reader.onload = () => resolve(reader.result.split(',')[1]);
-            reader.readAsDataURL(imageFile);
-        });
-    }
+    const form = new FormData();
+    form.append('text', document.getElementById('text').value);
+    if (imageFile) form.append('image', imageFile);
 
     document.getElementById('result').innerHTML = `
-        <div class="loading"><div class="spinner"></div><p>Analyzing... Please wait 10-20 seconds</p></div>`;
+        <div id="caption"></div>
+        <div class="result"><strong>Expert Advice:</strong><br><br><span id="advice"></span>
+        <div class="loading" id="loading"><div class="spinner"></div><p>Analyzing...</p></div></div>`;
 
-    const resp = await fetch('/analyze', {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({text, image})
-    });
-    const data = await resp.json();
+    const resp = await fetch('/analyze/stream', {method: 'POST', body: form});
+    if (!resp.ok) {
+        document.getElementById('loading').style.display = 'none';
+        document.getElementById('advice').textContent = (await resp.json()).error;
+        return;
+    }
 
-    let html = '';
-    if (data.image_analysis) {
-        html += `<div style="background:#fff3cd;padding:15px;border-radius:10px;margin-bottom:15px">
-                    <strong>Image Analysis:</strong><br>${data.image_analysis}</div>`;
+    const advice = document.getElementById('advice');
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, {stream: true});
+        const events = buffer.split('\\n\\n');
+        buffer = events.pop();
+        for (const raw of events) {
+            const event = raw.match(/^event: (.*)$/m)[1];
+            const data = JSON.parse(raw.match(/^data: (.*)$/m)[1]);
+            if (event === 'caption') {
+                document.getElementById('caption').innerHTML =
+                    `<div style="background:#fff3cd;padding:15px;border-radius:10px;margin-bottom:15px">
+                        <strong>Image Analysis:</strong><br>${data.image_analysis}</div>`;
+            } else if (event === 'token') {
+                document.getElementById('loading').style.display = 'none';
+                advice.textContent += data.text;
+            } else if (event === 'done') {
+                advice.textContent = data.advice;
+            } else if (event === 'error') {
+                advice.textContent = data.advice ? `${data.advice} … (${data.error})` : data.error;
+            }
+        }
     }
-    html += `<div class="result"><strong>Expert Advice:</strong><br><br>${data.advice}</div>`;
-    document.getElementById('result').innerHTML = html;
+    document.getElementById('loading').style.display = 'none';
 }
 
 function clearAll() {
     document.getElementById('text').value = '';
-    document.getElementById('preview').innerHTML = '';
+    const preview = document.getElementById('preview');
+    if (preview) preview.innerHTML = '';
     document.getElementById('result').innerHTML = '';
     imageFile = null;
 }
@@ -268,64 +1337,1078 @@ function clearAll() {
 """
 
 
-@app.route('/')
+bp = Blueprint("agro", __name__)
+
+
+def enabled(modality):
+    return modality in current_app.config["AGRO_MODALITIES"]
+
+
+def disabled(modality):
+    return jsonify({"error": f"{modality} input is not enabled on this server"}), 501
+
+
+def requested_adapter(fields):
+    """The LoRA adapter picked by the X-Agro-Adapter header or the ``adapter`` field, None if unknown"""
+    name = request.headers.get('X-Agro-Adapter') or fields.get('adapter') or DEFAULT_ADAPTER
+    return name if name in ADAPTERS else None
+
+
+def unknown_adapter():
+    return jsonify({"error": f"Unknown adapter, available: {', '.join(ADAPTERS)}"}), 400
+
+
+def overloaded():
+    metrics.inc("agro_shed_requests_total", endpoint=request.endpoint)
+    return jsonify({"error": "Server is overloaded, try again later"}), 503, \
+        {"Retry-After": str(admission.retry_after())}
+
+
+def request_deadline():
+    """The request's deadline: REQUEST_TIMEOUT, or less if the client asked with X-Agro-Timeout"""
+    seconds = REQUEST_TIMEOUT
+    try:
+        seconds = min(seconds, float(request.headers.get('X-Agro-Timeout', seconds)))
+    except ValueError:
+        pass
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    return Deadline(seconds, sock)
+
+
+def admission_controlled(view):
+    """Admits the view's requests through ``admission`` and gives each a deadline.
+
+    A streamed response holds its turn until the stream is closed.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        deadline = request_deadline()
+        if not admission.enter(deadline.remaining()):
+            return overloaded()
+        started = time.perf_counter()
+        token = _deadline.set(deadline)
+        g.agro_deadline = deadline
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except BaseException:
+            admission.leave(time.perf_counter() - started)
+            raise
+        finally:
+            _deadline.reset(token)
+        response.call_on_close(lambda: admission.leave(time.perf_counter() - started))
+        return response
+    return wrapper
+
+
+def debug_requested():
+    return DEBUG_TIMINGS or request.args.get('debug') == '1' or request.headers.get('X-Agro-Debug') == '1'
+
+
+@bp.before_request
+def start_trace():
+    g.agro_started = time.perf_counter()
+    g.agro_timings = {}
+    _traces.set((g.agro_timings,))
+
+
+@bp.after_request
+def finish_trace(response):
+    # For streamed responses this covers the time until the headers went out
+    metrics.observe("agro_request_seconds", time.perf_counter() - g.agro_started, endpoint=request.endpoint)
+    metrics.inc("agro_requests_total", endpoint=request.endpoint, status=response.status_code)
+    if debug_requested() and g.agro_timings:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in g.agro_timings.items())
+    return response
+
+
+@bp.route('/')
 def index():
-    return render_template_string(HTML)
+    return render_template_string(HTML, modalities=current_app.config["AGRO_MODALITIES"])
 
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    data = request.json
-    text = data.get('text', '')
-    image_b64 = data.get('image')
+def load_image(img_bytes):
+    """Decodes an upload at roughly BLIP's input size instead of its full resolution"""
+    blip_processor, _ = blip.get()
+    size = blip_processor.image_processor.size
+    target = (size["width"], size["height"])
+
+    with stage("image_decode"):
+        img = Image.open(io.BytesIO(img_bytes))
+        # For JPEGs this makes the decoder downscale by 1/2, 1/4 or 1/8 while decoding
+        img.draft('RGB', target)
+        return img.convert('RGB').resize(target, Image.BICUBIC)
+
+
+def dhash(img):
+    """64-bit difference hash: survives re-encoding and resizing of the same photo"""
+    pixels = np.asarray(img.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
+
+
+def caption_batch(images):
+    blip_processor, blip_model = blip.get()
+    inputs = blip_processor(images, [CAPTION_PROMPT] * len(images), return_tensors="pt").to(device)
+    with stage("blip_generate"), torch.no_grad():
+        out = blip_model.generate(**inputs, max_new_tokens=60)
+    return blip_processor.batch_decode(out, skip_special_tokens=True)
+
+
+caption_scheduler = BatchScheduler(caption_batch, max_batch_size=CAPTION_BATCH_SIZE, name="caption-scheduler",
+                                   torch_threads=CAPTION_THREADS)
+
+
+def caption_image(img_bytes):
+    if caption_cache is None:
+        return caption_scheduler.submit(load_image(img_bytes)).result()
+
+    # Byte-identical uploads skip decoding entirely; re-encoded copies match on the perceptual hash
+    content_key = "sha256:" + hashlib.sha256(img_bytes).hexdigest()
+    caption = caption_cache.get(content_key)
+    if caption is None:
+        img = load_image(img_bytes)
+        visual_key = "dhash:" + dhash(img)
+        caption = caption_cache.get(visual_key)
+        if caption is None:
+            caption = caption_scheduler.submit(img).result()
+            caption_cache.put(visual_key, caption)
+        caption_cache.put(content_key, caption)
+    return caption
+
+
+def decode_b64(value):
+    try:
+        return base64.b64decode(value)
+    except (binascii.Error, ValueError):
+        # Left for describe_image to report as an unreadable image
+        return b""
+
+
+def read_limited(stream, limit):
+    """Reads a stream in chunks and gives up as soon as it grows past ``limit`` bytes"""
+    buf = io.BytesIO()
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return buf.getvalue()
+        if buf.tell() + len(chunk) > limit:
+            raise RequestEntityTooLarge(f"Upload is larger than {limit // (1024 * 1024)} MB")
+        buf.write(chunk)
+
+
+def read_upload(field, kind, limit):
+    """Returns the request's fields and the uploaded ``field`` bytes (None when absent).
+
+    Accepts multipart/form-data (the file in ``field``, other fields as form
+    values), a raw ``kind``/* or application/octet-stream body (other fields in
+    the query string), or the legacy JSON body with ``field`` base64 encoded.
+    """
+    with stage("upload"):
+        mimetype = request.mimetype
+        if mimetype == "multipart/form-data":
+            upload = request.files.get(field)
+            return request.form, (read_limited(upload.stream, limit) or None) if upload else None
+
+        if mimetype.startswith(kind + "/") or mimetype == "application/octet-stream":
+            if request.content_length is not None and request.content_length > limit:
+                raise RequestEntityTooLarge(f"Upload is larger than {limit // (1024 * 1024)} MB")
+            return request.args, read_limited(request.stream, limit) or None
+
+        data = request.get_json(silent=True) or {}
+        encoded = data.get(field)
+        if not encoded:
+            return data, None
+        # Every 4 base64 characters carry 3 bytes, so the size is known before decoding
+        if len(encoded) * 3 // 4 > limit:
+            raise RequestEntityTooLarge(f"Upload is larger than {limit // (1024 * 1024)} MB")
+        with stage("base64_decode"):
+            return data, decode_b64(encoded)
+
+
+@bp.app_errorhandler(RequestEntityTooLarge)
+def too_large(e):
+    return jsonify({"error": e.description}), 413
+
+
+@bp.app_errorhandler(AudioDecodeError)
+def undecodable_audio(e):
+    # ffmpeg's stderr ends with the reason; the rest is its banner and stream probing
+    reason = str(e).strip().splitlines()[-1] if str(e).strip() else "unknown format"
+    return jsonify({"error": f"Could not decode the audio upload: {reason}"}), 400
+
+
+@bp.app_errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    metrics.inc("agro_expired_requests_total", reason=e.reason)
+    # A disconnected client never sees this; the status only shows up in logs and metrics
+    return jsonify({"error": "Request deadline exceeded"}), 504
+
+
+def describe_image(text, image_bytes, pending_caption=None):
+    """Caption the uploaded image (or wait for a caption already in flight) and fold it into the farmer's text"""
+    try:
+        caption = pending_caption.result() if pending_caption is not None else caption_image(image_bytes)
+    except Exception:
+        return "Image uploaded", text
+
+    context = f"Image shows: {caption}. Farmer says: {text}" if text else caption
+    return caption, context
+
+
+def build_prompt(context):
+    return f"""{PROMPT_PREFIX}{context}</s>
+<|assistant|>"""
+
+
+def build_prefix_cache(adapter):
+    """Runs the shared prompt prefix through the model once and keeps its key/value cache"""
+    model, tokenizer = llm.get()
+    prefix_ids = tokenizer(PROMPT_PREFIX, return_tensors="pt")["input_ids"].to(device)
+    with model_lock, torch.no_grad():
+        adapter_kwargs = adapter_pool.activate(model, [adapter])
+        past = model(input_ids=prefix_ids, use_cache=True, **adapter_kwargs).past_key_values
+    if isinstance(past, DynamicCache):
+        past = past.to_legacy_cache()
+    return prefix_ids[0].tolist(), past
+
+
+# LoRA changes the attention projections, so every adapter has its own prefix cache
+prefix_caches = {}
+prefix_caches_lock = threading.Lock()
+
+
+def prefix_cache(adapter):
+    with prefix_caches_lock:
+        if adapter not in prefix_caches:
+            prefix_caches[adapter] = LazyModel(f"system prompt KV cache ({adapter})",
+                                               lambda: build_prefix_cache(adapter))
+        return prefix_caches[adapter]
+
+
+def load_qa_index():
+    """Indexes the curated corpus by the farmer's question, without any system prompt prefix"""
+    pairs = {}
+    if os.path.exists(CORPUS_PATH):
+        with open(CORPUS_PATH, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    example = json.loads(line)
+                    question = example["instruction"].split("Farmer's question:")[-1].strip()
+                    pairs.setdefault(normalize_text(question), (question, example["output"]))
+    return QAIndex(list(pairs.values()))
+
+
+qa_index = LazyModel("Q&A index", load_qa_index)
+
+
+def retrieve(text):
+    """Curated (score, question, answer) matches for the farmer's text, best first"""
+    if not RETRIEVAL or not text.strip():
+        return []
+    with stage("retrieve"):
+        return qa_index.get().search(text, RETRIEVAL_TOP_K)
+
+
+def curated_answer(matches, image_bytes, adapter):
+    """The curated answer, when the question is close enough to serve it without generating.
+
+    Only for text-only requests to the default adapter: with a photo, the
+    caption may change the diagnosis, and other adapters were trained on other answers.
+    """
+    if image_bytes is None and adapter == DEFAULT_ADAPTER and matches and \
+            matches[0][0] >= RETRIEVAL_ANSWER_THRESHOLD:
+        metrics.inc("agro_curated_answers_total")
+        return {"image_analysis": None, "advice": matches[0][2]}
+    return None
+
+
+def ground(context, matches):
+    """Puts the relevant curated answers in front of the farmer's context as reference material"""
+    references = [f'Reference advice for "{question}":\n{answer[:GROUNDING_CHARS]}'
+                  for score, question, answer in matches if score >= RETRIEVAL_CONTEXT_THRESHOLD]
+    if not references:
+        return context
+    return "\n\n".join(references) + f"\n\nFarmer's question: {context}"
+
+
+def encode_prompts(contexts, adapters):
+    """Tokenizes prompts for generate(), starting from the system prompt's cached keys/values.
+
+    Rows are laid out as the shared prefix, then left padding, then the
+    farmer-specific part. The padding is masked out, so position ids carry on
+    straight from the prefix and only the farmer-specific tokens are prefilled.
+    """
+    _, tokenizer = llm.get()
+    with stage("tokenize"):
+        return _encode_prompts(tokenizer, [build_prompt(context) for context in contexts], adapters)
+
+
+def _encode_prompts(tokenizer, prompts, adapters):
+    if not PREFIX_CACHE:
+        return dict(tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device))
+
+    prefixes = {adapter: prefix_cache(adapter).get() for adapter in set(adapters)}
+    prefix_ids = next(iter(prefixes.values()))[0]
+    n = len(prefix_ids)
+    rows = tokenizer(prompts, truncation=True, max_length=512)["input_ids"]
+    if any(len(row) <= n or row[:n] != prefix_ids for row in rows):
+        # The prefix tokenized differently inside this prompt, so the cache does not apply
+        return dict(tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=512).to(device))
+
+    suffixes = [row[n:] for row in rows]
+    width = max(len(suffix) for suffix in suffixes)
+    input_ids = [prefix_ids + [tokenizer.pad_token_id] * (width - len(suffix)) + suffix for suffix in suffixes]
+    attention_mask = [[1] * n + [0] * (width - len(suffix)) + [1] * len(suffix) for suffix in suffixes]
+
+    # generate() appends to the cache by concatenation, so the shared tensors are never written to
+    if len(prefixes) == 1:
+        _, prefix_past = prefixes[adapters[0]]
+        batch = len(rows)
+        layers = [(key.expand(batch, -1, -1, -1), value.expand(batch, -1, -1, -1)) for key, value in prefix_past]
+    else:
+        # A mixed-adapter batch stacks each row's own adapter's prefix
+        layers = [
+            tuple(torch.cat([prefixes[adapter][1][layer][kv] for adapter in adapters]) for kv in (0, 1))
+            for layer in range(len(prefixes[adapters[0]][1]))
+        ]
+    past = DynamicCache.from_legacy_cache(tuple(layers))
+    return {
+        "input_ids": torch.tensor(input_ids, device=device),
+        "attention_mask": torch.tensor(attention_mask, device=device),
+        "past_key_values": past,
+    }
+
+
+class StopAtDeadline(StoppingCriteria):
+    """Stops each row whose request ran out of time or lost its client; the rest of the batch carries on"""
+
+    def __init__(self, deadlines):
+        self.deadlines = deadlines
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([deadline is not None and deadline.expired() for deadline in self.deadlines],
+                            dtype=torch.bool, device=input_ids.device)
+
+
+class StopAtBudget(StoppingCriteria):
+    """Stops each row once it has generated its own number of tokens"""
+
+    def __init__(self, prompt_length, budgets):
+        self.prompt_length = prompt_length
+        self.budgets = torch.tensor(budgets)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return input_ids.shape[1] - self.prompt_length >= self.budgets.to(input_ids.device)
+
+
+class StopOnRepetition(StoppingCriteria):
+    """Stops each row whose last ``ngram`` tokens already appear ``limit`` times earlier in its answer"""
+
+    def __init__(self, prompt_length, ngram=REPEAT_NGRAM, limit=REPEAT_LIMIT):
+        self.prompt_length = prompt_length
+        self.ngram = ngram
+        self.limit = limit
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids[:, self.prompt_length:]
+        if generated.shape[1] < self.ngram * (self.limit + 1):
+            return torch.zeros(len(input_ids), dtype=torch.bool, device=input_ids.device)
+        windows = generated.unfold(1, self.ngram, 1)
+        repeats = (windows[:, :-1] == windows[:, -1:]).all(-1).sum(-1)
+        return repeats >= self.limit
+
+
+class BatchStreamer:
+    """Hands each row of a batched generate() to its own streamer.
+
+    generate() calls put() with the prompt first, then with every step's new
+    token(s) for the whole batch. Each row's tokens go to its streamer (rows
+    without one are skipped) until the row's EOS ends it; end() ends the rest.
+    """
+
+    def __init__(self, streamers, eos_token_id):
+        self.streamers = list(streamers)
+        self.eos_token_id = eos_token_id
+        self._prompt = True
+
+    def put(self, value):
+        if self._prompt:
+            self._prompt = False
+            return
+        value = value.reshape(len(self.streamers), -1)
+        for row, streamer in enumerate(self.streamers):
+            if streamer is None:
+                continue
+            tokens = value[row]
+            stops = (tokens == self.eos_token_id).nonzero()
+            if len(stops):
+                tokens = tokens[:stops[0, 0]]
+            if len(tokens):
+                streamer.put(tokens)
+            # Finished rows are padded with EOS until the whole batch is done
+            if len(stops):
+                streamer.end()
+                self.streamers[row] = None
+
+    def end(self):
+        for streamer in self.streamers:
+            if streamer is not None:
+                streamer.end()
+        self.streamers = [None] * len(self.streamers)
+
+
+class CountingStreamer(TextIteratorStreamer):
+    """A TextIteratorStreamer that also counts the tokens put into it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tokens = 0
+
+    def put(self, value):
+        self.tokens += value.numel()
+        super().put(value)
+
+
+def stream_text(streamer, future):
+    """The text a scheduled row streams, until its streamer ends or its future finishes without starting it"""
+    while True:
+        try:
+            text = next(streamer)
+        except StopIteration:
+            return
+        except queue.Empty:
+            # Items dropped by the scheduler (e.g. expired while queued) never touch their streamer
+            if future.done():
+                return
+            continue
+        if text:
+            yield text
+
+
+def trim_at_eos(token_ids, tokenizer):
+    stops = (token_ids == tokenizer.eos_token_id).nonzero()
+    return token_ids[:stops[0, 0]] if len(stops) else token_ids
+
+
+def trim_at_turn(text):
+    """Cuts off a new chat turn the model started before generation stopped"""
+    for marker in TURN_MARKERS:
+        text = text.split(marker)[0]
+    return text.strip()
+
+
+def token_budget(kind):
+    return min(TOKEN_BUDGETS.get(kind, GENERATION_KWARGS["max_new_tokens"]), GENERATION_KWARGS["max_new_tokens"])
+
+
+def generation_kwargs(tokenizer, prompt_length, budgets, criteria=()):
+    """GENERATION_KWARGS for rows with the given token budgets, plus the per-row early stopping criteria"""
+    criteria = [*criteria, StopOnRepetition(prompt_length)]
+    if len(set(budgets)) > 1:
+        criteria.append(StopAtBudget(prompt_length, budgets))
+    return dict(GENERATION_KWARGS, max_new_tokens=max(budgets), stop_strings=TURN_MARKERS, tokenizer=tokenizer,
+                stopping_criteria=StoppingCriteriaList(criteria))
+
+
+def assisted_kwargs():
+    """generate() arguments for the configured assisted decoding mode"""
+    if ASSISTED_DECODING == "prompt":
+        return {"prompt_lookup_num_tokens": PROMPT_LOOKUP_TOKENS}
+    if ASSISTED_DECODING:
+        return {"assistant_model": draft.get()}
+    return {}
+
+
+def generate_batch(items, deadlines=None):
+    """Generates advice for several (farmer context, adapter, token budget, streamer) items in one left-padded batch.
+
+    A row with a streamer (a TextIteratorStreamer, or None) also streams its
+    text as it is generated. ``deadlines`` (by default those of the scheduler
+    batch being run) stop the rows of requests that expire part way through.
+    """
+    if deadlines is None:
+        deadlines = _batch_deadlines.get() or (None,) * len(items)
+    if ASSISTED_DECODING and len(items) > 1:
+        # Drafts are verified for one sequence at a time, so assisted decoding runs the batch row by row
+        return [answer for item, deadline in zip(items, deadlines) for answer in generate_batch([item], [deadline])]
+
+    model, tokenizer = llm.get()
+    contexts = [context for context, _, _, _ in items]
+    adapters = [adapter for _, adapter, _, _ in items]
+    streamers = [streamer for _, _, _, streamer in items]
+    streamer = BatchStreamer(streamers, tokenizer.eos_token_id) if any(streamers) else None
+    try:
+        inputs = encode_prompts(contexts, adapters)
+
+        with model_lock, stage("llm_generate"), torch.no_grad():
+            adapter_kwargs = adapter_pool.activate(model, adapters)
+            criteria = [StopAtDeadline(deadlines)] if any(deadlines) else []
+            kwargs = generation_kwargs(tokenizer, inputs["input_ids"].shape[1], [budget for _, _, budget, _ in items],
+                                       criteria)
+            output = model.generate(**inputs, **kwargs, **assisted_kwargs(), **adapter_kwargs,
+                                    pad_token_id=tokenizer.pad_token_id, streamer=streamer)
+    finally:
+        # generate() ends the streamers itself; after a failure this unblocks their consumers straight away
+        if streamer:
+            streamer.end()
+
+    # Finished rows keep being padded with EOS until the longest row is done, so cut each row at its own EOS
+    new_tokens = [trim_at_eos(row, tokenizer) for row in output[:, inputs["input_ids"].shape[1]:]]
+    metrics.inc("agro_prompt_tokens_total", int(inputs["attention_mask"].sum()))
+    metrics.inc("agro_generated_tokens_total", sum(len(row) for row in new_tokens))
+    with stage("detokenize"):
+        return [trim_at_turn(tokenizer.decode(row, skip_special_tokens=True)) for row in new_tokens]
+
+
+llm_scheduler = BatchScheduler(generate_batch, name="llm-scheduler", torch_threads=LLM_THREADS)
+
+
+def run_analysis(text, image_bytes, pending_caption=None, adapter=DEFAULT_ADAPTER, kind=None):
+    """Captions the image (if any) and generates advice with the given LoRA adapter.
+
+    ``pending_caption`` is a Future for a caption that was started earlier,
+    e.g. alongside a transcription; only the wait for it is then timed.
+    ``kind`` picks the token budget, by default "image" or "text".
+    """
+    key = advice_key(text, image_bytes, adapter)
+    cached = advice_cache.get(key) if advice_cache else None
+    if cached:
+        return cached
+
+    matches = retrieve(text)
+    curated = curated_answer(matches, image_bytes, adapter)
+    if curated:
+        return curated
 
     context = text
+    caption = None
+
+    if image_bytes is not None:
+        with stage("caption_wait" if pending_caption is not None else "caption"):
+            caption, context = describe_image(text, image_bytes, pending_caption)
+
+    deadline = _deadline.get()
+    with stage("generate"):
+        budget = token_budget(kind or ("text" if image_bytes is None else "image"))
+        future = llm_scheduler.submit((ground(context, matches), adapter, budget, None))
+        answer = deadline.wait(future) if deadline else future.result()
+    if deadline and deadline.reason:
+        # A row cut short by its deadline is not an answer
+        raise DeadlineExceeded(deadline.reason)
+
+    result = {
+        "image_analysis": caption,
+        "advice": answer
+    }
+    if advice_cache and answer:
+        advice_cache.put(key, result)
+    return result
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@bp.route('/analyze', methods=['POST'])
+@admission_controlled
+def analyze():
+    if not enabled("text"):
+        return disabled("text")
+
+    fields, image_bytes = read_upload('image', 'image', MAX_IMAGE_BYTES)
+    text = fields.get('text', '')
+    if image_bytes is not None and not enabled("image"):
+        return disabled("image")
+    adapter = requested_adapter(fields)
+    if adapter is None:
+        return unknown_adapter()
+
+    return jsonify(run_analysis(text, image_bytes, adapter=adapter))
+
+
+@bp.route('/analyze/stream', methods=['POST'])
+@admission_controlled
+def analyze_stream():
+    """Same as /analyze, but pushes the caption and each decoded token as Server-Sent Events"""
+    if not enabled("text"):
+        return disabled("text")
+
+    fields, image_bytes = read_upload('image', 'image', MAX_IMAGE_BYTES)
+    text = fields.get('text', '')
+    if image_bytes is not None and not enabled("image"):
+        return disabled("image")
+    adapter = requested_adapter(fields)
+    if adapter is None:
+        return unknown_adapter()
+    key = advice_key(text, image_bytes, adapter)
+    matches = retrieve(text)
+
+    # The generator runs after this view returns, so it reports into this request's trace explicitly
+    timings = g.agro_timings
+    deadline = g.agro_deadline
+    debug = debug_requested()
+
+    def done(advice, tokens=None):
+        data = {"advice": advice}
+        if tokens is not None:
+            data["tokens"] = tokens
+        if debug:
+            data["timings"] = timings
+        return sse("done", data)
+
+    def replay(cached):
+        if cached["image_analysis"] is not None:
+            yield sse("caption", {"image_analysis": cached["image_analysis"]})
+        yield sse("token", {"text": cached["advice"]})
+        yield done(cached["advice"])
+
+    def events():
+        _traces.set((timings,))
+        _deadline.set(deadline)
+        context = text
+        caption = None
+        if image_bytes is not None:
+            with stage("caption"):
+                caption, context = describe_image(text, image_bytes)
+            yield sse("caption", {"image_analysis": caption})
+
+        # Streamed rows are batched with everything else on the LLM scheduler
+        _, tokenizer = llm.get()
+        streamer = CountingStreamer(tokenizer, skip_special_tokens=True, timeout=DISCONNECT_POLL_INTERVAL)
+        budget = token_budget("text" if image_bytes is None else "image")
+        future = llm_scheduler.submit((ground(context, matches), adapter, budget, streamer))
 
-    if image_b64:
         try:
-            img_bytes = base64.b64decode(image_b64)
-            img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
+            for token in stream_text(streamer, future):
+                yield sse("token", {"text": token})
+            try:
+                answer = future.result()
+            except DeadlineExceeded as e:
+                metrics.inc("agro_expired_requests_total", reason=e.reason)
+                yield sse("error", {"error": "Request deadline exceeded"})
+                return
+            except Exception as e:
+                yield sse("error", {"error": f"Generation failed: {e}"})
+                return
+            if not answer:
+                # Neither a failure nor an empty answer is worth keeping in the cache
+                yield sse("error", {"error": "No advice generated"})
+                return
+            if deadline.reason:
+                metrics.inc("agro_expired_requests_total", reason=deadline.reason)
+                yield sse("error", {"error": "Request deadline exceeded", "advice": answer})
+                return
+            yield done(answer, streamer.tokens)
+            if advice_cache:
+                advice_cache.put(key, {"image_analysis": caption, "advice": answer})
+        finally:
+            # Runs on completion and when the client disconnects mid-stream; an unfinished row stops
+            # at its next token, or is dropped if its batch has not started yet
+            if not future.done():
+                deadline.cancel()
+                future.cancel()
 
-            inputs = blip_processor(img, "a photo of a plant with", return_tensors="pt").to(device)
-            out = blip_model.generate(**inputs, max_new_tokens=60)
-            caption = blip_processor.decode(out[0], skip_special_tokens=True)
+    cached = (advice_cache.get(key) if advice_cache else None) or curated_answer(matches, image_bytes, adapter)
+    return Response(replay(cached) if cached else events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-            context = f"Image shows: {caption}. Farmer says: {text}" if text else caption
-        except:
-            caption = "Image uploaded"
 
-    prompt = f"""<|system|>
-You are an expert agricultural advisor for Indian farmers. Give practical, safe advice in simple language.</s>
-<|user|>
-{context}</s>
-<|assistant|>"""
+def run_job(job):
+    return run_analysis(job.text, job.image_bytes, adapter=job.adapter)
+
+
+job_queue = JobQueue(run_job)
 
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512).to(device)
-    with torch.no_grad():
-        output = model.generate(**inputs, max_new_tokens=500, temperature=0.7, do_sample=True, repetition_penalty=1.2)
 
-    response = tokenizer.decode(output[0], skip_special_tokens=True)
-    answer = response.split("<|assistant|>")[-1].strip()
+@bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queues an /analyze request and returns its id straight away"""
+    if not enabled("text"):
+        return disabled("text")
 
+    fields, image_bytes = read_upload('image', 'image', MAX_IMAGE_BYTES)
+    if image_bytes is not None and not enabled("image"):
+        return disabled("image")
+    adapter = requested_adapter(fields)
+    if adapter is None:
+        return unknown_adapter()
+
+    try:
+        job = job_queue.submit(fields.get('text', ''), image_bytes, adapter)
+    except queue.Full:
+        return jsonify({"error": "Too many queued jobs, try again later"}), 503, {"Retry-After": "5"}
+
+    url = f"/jobs/{job.id}"
+    return jsonify({"id": job.id, "status": job.status, "url": url}), 202, {"Location": url}
+
+
+@bp.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Reports a job's status; ``?wait=<seconds>`` holds the request until it finishes or the wait runs out"""
+    wait = min(request.args.get('wait', 0, type=float), MAX_JOB_WAIT)
+    job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint: stage latencies, token counts, queue waits and memory"""
+    gauges = [("agro_job_queue_depth", {}, job_queue.depth())]
+    gauges += [(f"agro_admission_{state}_requests", {}, count) for state, count in admission.stats().items()]
+    for model in (llm, draft, blip, asr, *list(prefix_caches.values())):
+        gauges.append(("agro_model_loaded", {"model": model.name}, int(model.loaded)))
+        gauges.append(("agro_model_bytes", {"model": model.name}, model.nbytes()))
+    for name, cache in (("advice", advice_cache), ("caption", caption_cache)):
+        if cache:
+            stats = cache.stats()
+            gauges += [("agro_cache_entries", {"cache": name}, stats["entries"]),
+                       ("agro_cache_hits", {"cache": name}, stats["hits"]),
+                       ("agro_cache_misses", {"cache": name}, stats["misses"])]
+    rss = resident_bytes()
+    if rss is not None:
+        gauges.append(("agro_process_resident_bytes", {}, rss))
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route('/adapters')
+def list_adapters():
+    return jsonify({"default": DEFAULT_ADAPTER, "available": list(ADAPTERS), "loaded": adapter_pool.loaded()})
+
+
+@bp.route('/cache/stats')
+def cache_stats():
     return jsonify({
-        "image_analysis": caption if image_b64 else None,
-        "advice": answer
+        "advice": advice_cache.stats() if advice_cache else None,
+        "caption": caption_cache.stats() if caption_cache else None,
     })
 
 
-@app.route('/transcribe', methods=['POST'])
+def decode_audio(audio_bytes):
+    """Decodes browser audio (webm/opus, wav, ...) to Whisper's 16 kHz mono float32 in memory"""
+    cmd = [
+        "ffmpeg",
+        "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(whisper.audio.SAMPLE_RATE),
+        "pipe:1",
+    ]
+    proc = subprocess.run(cmd, input=audio_bytes, capture_output=True)
+    if proc.returncode != 0:
+        raise AudioDecodeError(f"Failed to decode audio: {proc.stderr.decode(errors='replace')}")
+    return np.frombuffer(proc.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def voiced_segments(audio):
+    """(start, end) sample ranges of ``audio`` that hold speech, by per-frame energy"""
+    frame = whisper.audio.SAMPLE_RATE * VAD_FRAME_MS // 1000
+    n = len(audio) // frame
+    if n == 0:
+        return []
+    frames = audio[:n * frame].reshape(n, frame)
+    db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    # Noise floor from the quieter end of the recording, where a speaker has not started or has finished
+    edge = max(1, VAD_EDGE_MS // VAD_FRAME_MS)
+    floor = min(np.median(db[:edge]), np.median(db[-edge:]))
+    threshold = max(VAD_MIN_DB, min(floor + VAD_MARGIN_DB, VAD_MAX_DB, db.max() - VAD_MARGIN_DB))
+    voiced = db > threshold
+
+    # A frame is kept when any frame within VAD_PAD_MS of it is voiced
+    pad = VAD_PAD_MS // VAD_FRAME_MS
+    counts = np.concatenate(([0], np.cumsum(voiced)))
+    index = np.arange(n)
+    voiced = counts[np.minimum(index + pad + 1, n)] - counts[np.maximum(index - pad, 0)] > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+
+    # Pauses shorter than VAD_MIN_PAUSE_MS belong to the speech around them
+    min_pause = VAD_MIN_PAUSE_MS // VAD_FRAME_MS
+    segments = []
+    for start, end in zip(edges[::2], edges[1::2]):
+        if segments and start - segments[-1][1] < min_pause:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+    return [(start * frame, end * frame if end < n else len(audio)) for start, end in segments]
+
+
+def speech_chunks(audio):
+    """The voiced parts of ``audio`` joined together, in pieces that each fit one 30 s Whisper window.
+
+    Segments are packed whole where they fit; a single segment longer than a
+    window is cut at the window length.
+    """
+    chunks, current, length = [], [], 0
+    for start, end in voiced_segments(audio):
+        for piece_start in range(start, end, whisper.audio.N_SAMPLES):
+            piece = audio[piece_start:min(end, piece_start + whisper.audio.N_SAMPLES)]
+            if length + len(piece) > whisper.audio.N_SAMPLES:
+                chunks.append(np.concatenate(current))
+                current, length = [], 0
+            current.append(piece)
+            length += len(piece)
+    if current:
+        chunks.append(np.concatenate(current))
+    return chunks
+
+
+def transcribe_audio(audio_bytes):
+    with stage("audio_decode"):
+        audio = decode_audio(audio_bytes)
+    if not VAD:
+        with asr_lock, stage("whisper"):
+            pin_torch_threads(ASR_THREADS)
+            return asr.get().transcribe(audio, fp16=device == "cuda")["text"]
+
+    with stage("vad"):
+        chunks = speech_chunks(audio)
+    sample_rate = whisper.audio.SAMPLE_RATE
+    metrics.inc("agro_audio_seconds_total", len(audio) / sample_rate, part="received")
+    metrics.inc("agro_audio_seconds_total", sum(map(len, chunks)) / sample_rate, part="transcribed")
+    if not chunks:
+        # Nothing but silence; Whisper tends to hallucinate a sentence for that
+        return ""
+
+    deadline = _deadline.get()
+    with asr_lock, stage("whisper"):
+        # Whisper cannot be stopped part way, so a request that expired while waiting for it is dropped here
+        if deadline:
+            deadline.check()
+        pin_torch_threads(ASR_THREADS)
+        model = asr.get()
+        if len(chunks) == 1:
+            return model.transcribe(chunks[0], fp16=device == "cuda")["text"]
+        # Longer recordings: every window goes through the encoder and decoder as one batch
+        mels = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(chunk), model.dims.n_mels)
+                            for chunk in chunks]).to(model.device)
+        results = whisper.decode(model, mels, whisper.DecodingOptions(fp16=device == "cuda"))
+        return " ".join(result.text.strip() for result in results)
+
+
+@bp.route('/transcribe', methods=['POST'])
+@admission_controlled
 def transcribe():
-    audio_b64 = request.json['audio']
-    audio_bytes = base64.b64decode(audio_b64)
+    if not enabled("voice"):
+        return disabled("voice")
+
+    _, audio_bytes = read_upload('audio', 'audio', MAX_AUDIO_BYTES)
+    if not audio_bytes:
+        return jsonify({"error": "No audio uploaded"}), 400
+
+    return jsonify({"text": transcribe_audio(audio_bytes)})
+
+
+# Pre-LLM stages get their own threads so a transcription and a caption can overlap
+asr_executor = ThreadPoolExecutor(max_workers=ASR_WORKERS, thread_name_prefix="asr")
+caption_executor = ThreadPoolExecutor(max_workers=CAPTION_BATCH_SIZE, thread_name_prefix="caption")
+
+
+@bp.route('/analyze/multimodal', methods=['POST'])
+@admission_controlled
+def analyze_multimodal():
+    """Takes an image and a voice note together, transcribing and captioning them concurrently.
+
+    The transcript is appended to any typed text and the LLM starts as soon as
+    both pre-stages are done. Responds like /analyze plus the transcript.
+    """
+    if not enabled("text"):
+        return disabled("text")
+
+    fields, image_bytes = read_upload('image', 'image', MAX_IMAGE_BYTES)
+    _, audio_bytes = read_upload('audio', 'audio', MAX_AUDIO_BYTES)
+    if image_bytes is not None and not enabled("image"):
+        return disabled("image")
+    if audio_bytes is not None and not enabled("voice"):
+        return disabled("voice")
+    adapter = requested_adapter(fields)
+    if adapter is None:
+        return unknown_adapter()
+
+    # Executor threads do not inherit context, so each stage runs in a copy carrying this request's trace
+    pending_caption = None
+    if image_bytes is not None:
+        pending_caption = caption_executor.submit(contextvars.copy_context().run, in_stage, "caption",
+                                                  caption_image, image_bytes)
+
+    text = fields.get('text', '')
+    transcript = None
+    if audio_bytes is not None:
+        future = asr_executor.submit(contextvars.copy_context().run, in_stage, "transcribe",
+                                     transcribe_audio, audio_bytes)
+        deadline = _deadline.get()
+        transcript = deadline.wait(future) if deadline else future.result()
+        text = f"{text} {transcript.strip()}".strip()
+
+    result = run_analysis(text, image_bytes, pending_caption, adapter,
+                          kind="voice" if audio_bytes is not None and image_bytes is None else None)
+    return jsonify({"transcript": transcript, **result})
+
+
+def models_for(modalities):
+    """Every lazily loaded model the given modalities use"""
+    models = [MODALITY_MODELS[modality] for modality in modalities]
+    if "text" in modalities:
+        if PREFIX_CACHE:
+            models.append(prefix_cache(DEFAULT_ADAPTER))
+        if ASSISTED_DECODING not in (None, "prompt"):
+            models.append(draft)
+    return models
+
+
+def preload(modalities):
+    """Loads the models in the current (master) process ahead of gunicorn's fork.
+
+    Tensor storage is never written after loading, so forked workers keep
+    sharing its pages copy-on-write. Loading runs single-threaded: an OpenMP
+    thread team started before fork() would hang the workers' first matmul.
+    CPU only: a worker cannot use CUDA once its parent has initialized it.
+    """
+    if device == "cuda":
+        raise RuntimeError("AGRO_PRELOAD=1 is not supported on CUDA hosts; forked workers cannot use "
+                           "CUDA initialized in the master")
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    try:
+        for model in models_for(modalities):
+            model.get()
+    finally:
+        torch.set_num_threads(threads)
+    # Moves everything loaded so far out of the collector's reach, so its bookkeeping
+    # writes do not un-share the pages holding those objects
+    gc.collect()
+    gc.freeze()
+
+
+def configure_worker(workers):
+    """Runs in each gunicorn worker after the fork: splits the cores between the workers and warms them up"""
+    global default_torch_threads
+    threads = int(os.environ.get("AGRO_TORCH_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+    default_torch_threads = threads
+    torch.set_num_threads(threads)
+    print(f"Worker {os.getpid()}: {threads} torch threads")
+    # Threads do not survive fork(), so each worker runs its own warm-up and job threads; starting
+    # the latter now also picks up jobs left queued by a worker that was restarted
+    start_warm_up(app.config["AGRO_MODALITIES"])
+    if "text" in app.config["AGRO_MODALITIES"]:
+        job_queue.start()
+
+
+# Set once the startup warm-up has run a request through every enabled model
+ready = threading.Event()
+warm_up_error = None
+
+
+def warm_up_inference(modalities):
+    """Pushes one small request through each enabled model.
+
+    The first call into a model pays one-time costs (kernel selection,
+    allocator growth, tokenizer caches) that would otherwise land on the
+    first farmer's request.
+    """
+    if "text" in modalities:
+        llm_scheduler.submit((WARM_UP_QUESTION, DEFAULT_ADAPTER, WARM_UP_TOKENS, None)).result()
+    if "image" in modalities:
+        blip_processor, _ = blip.get()
+        size = blip_processor.image_processor.size
+        caption_scheduler.submit(Image.new('RGB', (size["width"], size["height"]), (96, 140, 64))).result()
+    if "voice" in modalities:
+        # Straight to Whisper: the silence detector would skip a silent clip
+        with asr_lock:
+            pin_torch_threads(ASR_THREADS)
+            asr.get().transcribe(np.zeros(whisper.audio.SAMPLE_RATE, np.float32), fp16=device == "cuda")
+
+
+def warm_up(modalities):
+    global warm_up_error
+    try:
+        # Models load side by side, then each gets a request
+        for thread in [model.warm_up() for model in models_for(modalities)]:
+            thread.join()
+        started = time.time()
+        warm_up_inference(modalities)
+        print(f"✓ Warm-up inference done in {time.time() - started:.1f}s")
+        ready.set()
+    except Exception as e:
+        warm_up_error = f"{type(e).__name__}: {e}"
+        print(f"❌ Warm-up failed: {warm_up_error}")
+
+
+def start_warm_up(modalities):
+    """Warms up on a background thread; /readyz answers 503 until it is done"""
+    thread = threading.Thread(target=warm_up, args=(modalities,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the process is up and answering, whether or not the models are ready"""
+    return jsonify({"status": "ok"})
+
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: 200 once every enabled model has loaded and served its warm-up request"""
+    if ready.is_set():
+        return jsonify({"status": "ready"})
+    models = {model.name: model.loaded for model in models_for(current_app.config["AGRO_MODALITIES"])}
+    if warm_up_error:
+        return jsonify({"status": "failed", "error": warm_up_error, "models": models}), 503
+    return jsonify({"status": "warming_up", "models": models}), 503
+
+
+def create_app(modalities=None, warmup=None):
+    """Builds the Flask app.
+
+    ``modalities`` defaults to $AGRO_MODALITIES (comma separated, all of
+    text,image,voice when unset). Models are only loaded for enabled
+    modalities, on first use, or right away on background threads when
+    ``warmup`` (or $AGRO_WARMUP=1) is set, followed by one warm-up request
+    each; /readyz reports ready once that is done. With $AGRO_PRELOAD=1
+    they are loaded before this returns, for gunicorn's preload_app, and
+    each worker warms up after the fork.
+    """
+    if modalities is None:
+        modalities = os.environ.get("AGRO_MODALITIES", ",".join(MODALITIES)).split(",")
+    modalities = tuple(m.strip() for m in modalities if m.strip())
+    unknown = set(modalities) - set(MODALITIES)
+    if unknown:
+        raise ValueError(f"Unknown modalities: {', '.join(sorted(unknown))}")
+
+    if warmup is None:
+        warmup = os.environ.get("AGRO_WARMUP") == "1"
+
+    # Create folders
+    os.makedirs("uploads/images", exist_ok=True)
+    os.makedirs("uploads/audio", exist_ok=True)
+
+    app = Flask(__name__)
+    app.config["AGRO_MODALITIES"] = modalities
+    # Werkzeug refuses larger bodies from Content-Length alone, before reading them
+    app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+    app.register_blueprint(bp)
+
+    # The Q&A index takes milliseconds to build, so it is ready before the first request either way
+    if RETRIEVAL and "text" in modalities:
+        qa_index.get()
 
-    with open("temp.wav", "wb") as f:
-        f.write(audio_bytes)
+    if PRELOAD:
+        preload(modalities)
+    elif warmup:
+        start_warm_up(modalities)
+    else:
+        # Models load on first use, so there is nothing to wait for
+        ready.set()
 
-    result = whisper_model.transcribe("temp.wav")
-    os.remove("temp.wav")
+    print(f"AgroExpert Vision serving: {', '.join(modalities)}")
+    return app
 
-    return jsonify({"text": result["text"]})
 
+app = create_app()
 
 # OLD (default port 5000)
 # app.run(host='127.0.0.1', port=5000, debug=False)
@@ -333,4 +2416,4 @@ def transcribe():
 # NEW → Use port 7860
 if __name__ == '__main__':
     print("Open → http://127.0.0.1:7860")
-    app.run(host='0.0.0.0', port=7860, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=7860, debug=False)
@@ -0,0 +1,188 @@
+# batch_infer.py  →  Run a folder (or JSONL manifest) of field photos and voice notes through the models offline
+import argparse
+import json
+import os
+import sys
+import time
+
+import app_agro as agro
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+AUDIO_EXTS = {".webm", ".wav", ".mp3", ".ogg", ".m4a", ".opus"}
+
+parser = argparse.ArgumentParser(description="Batch inference over image and audio files")
+parser.add_argument("source", help="directory to walk, or a JSONL manifest of "
+                                   '{"id", "image", "audio", "text", "adapter"} entries')
+parser.add_argument("--output", default="batch_results.jsonl", help="results are appended here, one line per item")
+parser.add_argument("--batch-size", type=int, default=agro.MAX_BATCH_SIZE, help="items per model batch")
+parser.add_argument("--adapter", default=agro.DEFAULT_ADAPTER, help="adapter for items that do not name one")
+parser.add_argument("--restart", action="store_true", help="ignore existing results instead of resuming")
+args = parser.parse_args()
+
+
+def walk(directory):
+    """One item per image or audio file, in a stable order so resumed runs line up"""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            ext = os.path.splitext(name)[1].lower()
+            if ext in IMAGE_EXTS:
+                yield {"id": os.path.relpath(path, directory), "image": path}
+            elif ext in AUDIO_EXTS:
+                yield {"id": os.path.relpath(path, directory), "audio": path}
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            # Media paths are relative to the manifest
+            for field in ("image", "audio"):
+                if item.get(field):
+                    item[field] = os.path.join(base, item[field])
+            item.setdefault("id", item.get("image") or item.get("audio") or item.get("text"))
+            yield item
+
+
+def done_ids(path):
+    """Ids an earlier, possibly interrupted, run already answered.
+
+    Items written with an error are left out so a resumed run retries them;
+    the retry appends a new line, and the latest line for an id wins.
+    """
+    succeeded = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                    succeeded[result["id"]] = "error" not in result
+                except (ValueError, KeyError):
+                    # A line cut short by the interruption; that item is redone
+                    pass
+    return {id_ for id_, ok in succeeded.items() if ok}
+
+
+def chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def run_chunk(chunk):
+    results = [{"id": item["id"], "image": item.get("image"), "audio": item.get("audio"),
+                "text": item.get("text", ""), "adapter": item.get("adapter") or args.adapter} for item in chunk]
+
+    for result in results:
+        if result["adapter"] not in agro.ADAPTERS:
+            result["error"] = f"Unknown adapter {result['adapter']}"
+
+    # Captions: decode every image, then caption them in batches
+    with_images = []
+    for result in results:
+        if result["image"] and "error" not in result:
+            try:
+                with_images.append((result, agro.load_image(read_bytes(result["image"]))))
+            except Exception as e:
+                result["error"] = f"Unreadable image: {e}"
+    for start in range(0, len(with_images), agro.CAPTION_BATCH_SIZE):
+        batch = with_images[start:start + agro.CAPTION_BATCH_SIZE]
+        try:
+            captions = agro.caption_batch([image for _, image in batch])
+        except Exception as e:
+            # One bad batch fails its own items, not the run
+            for result, _ in batch:
+                result["error"] = f"Captioning failed: {e}"
+            continue
+        for (result, _), caption in zip(batch, captions):
+            result["image_analysis"] = caption
+
+    # Transcripts: Whisper takes one recording at a time
+    for result in results:
+        if result["audio"] and "error" not in result:
+            try:
+                result["transcript"] = agro.transcribe_audio(read_bytes(result["audio"])).strip()
+                result["text"] = f"{result['text']} {result['transcript']}".strip()
+            except Exception as e:
+                result["error"] = f"Transcription failed: {e}"
+
+    # Advice: curated answers where they match, one batched generate() for the rest
+    pending = []
+    for result in results:
+        if "error" in result:
+            continue
+        text = result["text"]
+        caption = result.get("image_analysis")
+        matches = agro.retrieve(text)
+        # Photos never take the curated shortcut; the caption may change the diagnosis
+        curated = agro.curated_answer(matches, None, result["adapter"]) if caption is None else None
+        if curated:
+            result["advice"] = curated["advice"]
+            continue
+        context = text
+        if caption is not None:
+            context = f"Image shows: {caption}. Farmer says: {text}" if text else caption
+        kind = "image" if caption is not None else "voice" if result["audio"] else "text"
+        pending.append((result, (agro.ground(context, matches), result["adapter"], agro.token_budget(kind), None)))
+
+    if pending:
+        try:
+            answers = agro.generate_batch([item for _, item in pending])
+        except Exception as e:
+            for result, _ in pending:
+                result["error"] = f"Generation failed: {e}"
+            return results
+        for (result, _), answer in zip(pending, answers):
+            result["advice"] = answer
+    return results
+
+
+def main():
+    items = read_manifest(args.source) if os.path.isfile(args.source) else walk(args.source)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    skip = done_ids(args.output)
+    if skip:
+        print(f"Resuming: {len(skip)} items already answered in {args.output}")
+
+    processed = failed = 0
+    started = time.time()
+    # Terminate a line cut short by the interruption so the next result starts on its own line
+    if os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        with open(args.output, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    with open(args.output, "a", encoding="utf-8") as out:
+        for chunk in chunks((item for item in items if item["id"] not in skip), args.batch_size):
+            for result in run_chunk(chunk):
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                failed += "error" in result
+            # Flushed per chunk, so an interruption loses at most the chunk in flight
+            out.flush()
+            os.fsync(out.fileno())
+            processed += len(chunk)
+            print(f"  {processed} items, {processed / (time.time() - started):.2f} items/s")
+
+    print(f"✅ {processed} items processed ({failed} failed), results in {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+# benchmark.py  →  Drive /analyze and /transcribe with a realistic request mix and report latency as JSON
+import argparse
+import glob
+import json
+import os
+import random
+import resource
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+parser = argparse.ArgumentParser(description="Load-test the AgroExpert endpoints")
+parser.add_argument("--url", help="server to hit, e.g. http://127.0.0.1:7860 (default: in-process Flask test client)")
+parser.add_argument("--requests", type=int, default=40, help="measured requests")
+parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests sent first")
+parser.add_argument("--concurrency", type=int, default=4)
+parser.add_argument("--mix", default="text=4,image=2,stream=2,transcribe=1",
+                    help="relative weights of text, image, stream and transcribe requests")
+parser.add_argument("--questions", help="file of farmer questions, one per line (default: the training questions, "
+                                        "which the curated-answer shortcut mostly serves without generating)")
+parser.add_argument("--retrieval", action="store_true",
+                    help="keep the curated-answer shortcut on in-process; off by default so every request "
+                         "reaches the LLM (with --url, start the server with AGRO_RETRIEVAL=0 for the same)")
+parser.add_argument("--pid", type=int, help="server pid to read peak RSS from when using --url")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", help="write the JSON report here instead of stdout")
+args = parser.parse_args()
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webm": "audio/webm",
+                 ".wav": "audio/wav", ".mp3": "audio/mpeg", ".ogg": "audio/ogg"}
+
+
+def load_corpus():
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        # Only the farmer's part of the instruction; some carry the training system prompt in front
+        with open("data/agro_train.jsonl") as f:
+            questions = sorted({json.loads(line)["instruction"].split("Farmer's question:")[-1].strip()
+                                for line in f if line.strip()})
+
+    def read_all(pattern):
+        files = []
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "rb") as f:
+                files.append((f.read(), CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")))
+        return files
+
+    return questions, read_all("agro_images/*"), read_all("agro_recordings/*")
+
+
+class InProcessClient:
+    """Calls the app through Flask's test client, one client per request so threads do not share state"""
+
+    def __init__(self):
+        if not args.retrieval:
+            os.environ["AGRO_RETRIEVAL"] = "0"
+        import app_agro
+        self.app = app_agro.app
+
+    def post(self, path, body, content_type, query=None):
+        if query:
+            path += "?" + urllib.parse.urlencode(query)
+        response = self.app.test_client().post(path, data=body, content_type=content_type, buffered=False)
+        return response.status_code, self.body(response)
+
+    @staticmethod
+    def body(response):
+        # Closing runs the app's call_on_close hooks, which is where admission control frees the slot
+        try:
+            yield from response.response
+        finally:
+            response.close()
+
+
+class HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def post(self, path, body, content_type, query=None):
+        url = self.url + path + ("?" + urllib.parse.urlencode(query) if query else "")
+        req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": content_type})
+        try:
+            response = urllib.request.urlopen(req, timeout=600)
+        except urllib.error.HTTPError as e:
+            return e.code, [e.read()]
+        return response.status, iter(lambda: response.read1(4096), b"")
+
+
+def run_text(client, rng, questions, images, recordings):
+    body = json.dumps({"text": rng.choice(questions)}).encode()
+    status, chunks = client.post("/analyze", body, "application/json")
+    b"".join(chunks)
+    return {"ok": status == 200}
+
+
+def run_image(client, rng, questions, images, recordings):
+    image, content_type = rng.choice(images)
+    status, chunks = client.post("/analyze", image, content_type, {"text": rng.choice(questions)})
+    b"".join(chunks)
+    return {"ok": status == 200}
+
+
+def run_stream(client, rng, questions, images, recordings):
+    started = time.perf_counter()
+    body = json.dumps({"text": rng.choice(questions)}).encode()
+    status, chunks = client.post("/analyze/stream", body, "application/json")
+
+    first_token = None
+    tokens = None
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        *events, buffer = buffer.split(b"\n\n")
+        for event in events:
+            if event.startswith(b"event: token") and first_token is None:
+                first_token = time.perf_counter()
+            elif event.startswith(b"event: done"):
+                # Token events carry whole words; the done event has the real token count
+                tokens = json.loads(event.split(b"data: ", 1)[1]).get("tokens")
+    finished = time.perf_counter()
+
+    result = {"ok": status == 200 and first_token is not None}
+    if first_token is not None:
+        result["ttft"] = first_token - started
+        # Everything after the first token was generated during the decode phase
+        if tokens and tokens > 1 and finished > first_token:
+            result["tokens_per_sec"] = (tokens - 1) / (finished - first_token)
+    return result
+
+
+def run_transcribe(client, rng, questions, images, recordings):
+    audio, content_type = rng.choice(recordings)
+    status, chunks = client.post("/transcribe", audio, content_type)
+    b"".join(chunks)
+    return {"ok": status == 200}
+
+
+RUNNERS = {"text": run_text, "image": run_image, "stream": run_stream, "transcribe": run_transcribe}
+
+
+def summarize(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+    }
+
+
+def peak_rss_mb(pid):
+    if pid is None:
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    weights = {}
+    for part in args.mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in RUNNERS:
+            raise SystemExit(f"Unknown request kind in --mix: {kind}")
+        weights[kind] = float(weight or 1)
+
+    questions, images, recordings = load_corpus()
+    if not images:
+        weights.pop("image", None)
+    if not recordings:
+        weights.pop("transcribe", None)
+
+    rng = random.Random(args.seed)
+    kinds = rng.choices(list(weights), weights=list(weights.values()), k=args.warmup + args.requests)
+    seeds = [rng.randrange(2 ** 32) for _ in kinds]
+
+    client = HttpClient(args.url) if args.url else InProcessClient()
+    results = []
+    results_lock = threading.Lock()
+
+    def one(kind, seed, measured):
+        started = time.perf_counter()
+        try:
+            result = RUNNERS[kind](client, random.Random(seed), questions, images, recordings)
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result.update(kind=kind, latency=time.perf_counter() - started)
+        if measured:
+            with results_lock:
+                results.append(result)
+
+    for kind, seed in zip(kinds[:args.warmup], seeds[:args.warmup]):
+        one(kind, seed, measured=False)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for kind, seed in zip(kinds[args.warmup:], seeds[args.warmup:]):
+            pool.submit(one, kind, seed, True)
+    duration = time.perf_counter() - started
+
+    def stats(rows):
+        ok = [row for row in rows if row["ok"]]
+        return {
+            "requests": len(rows),
+            "errors": len(rows) - len(ok),
+            "latency": summarize([row["latency"] for row in ok]),
+            "ttft": summarize([row["ttft"] for row in ok if "ttft" in row]),
+            "tokens_per_sec": summarize([row["tokens_per_sec"] for row in ok if "tokens_per_sec" in row]),
+        }
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "target": args.url or "in-process",
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "mix": weights,
+            "questions": args.questions or "training",
+            "retrieval": args.retrieval if not args.url else "server",
+            "seed": args.seed,
+        },
+        "duration_s": duration,
+        "throughput_rps": len([row for row in results if row["ok"]]) / duration if duration else 0.0,
+        "overall": stats(results),
+        "by_kind": {kind: stats([row for row in results if row["kind"] == kind]) for kind in weights},
+        "peak_rss_mb": peak_rss_mb(args.pid if args.url else None),
+        "errors": sorted({row["error"] for row in results if "error" in row}),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"✅ Report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# build_dataset.py  →  Deduplicate and pre-tokenize the training data once, for train.py to memory-map
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+from datasets import Dataset, load_from_disk
+from transformers import AutoTokenizer
+
+MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+SOURCE = "data/agro_train.jsonl"
+OUTPUT_DIR = "data/agro_train_tokenized"
+MAX_LENGTH = 512
+
+# Bump when the tokenization logic below changes, so existing artifacts are rebuilt
+ARTIFACT_VERSION = 1
+
+PROMPT_TEMPLATE = """<|system|>
+You are an agricultural expert assistant helping farmers.</s>
+<|user|>
+{instruction}</s>
+<|assistant|>
+"""
+ANSWER_TEMPLATE = "{output}</s>"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_examples(source):
+    """Reads the JSONL corpus, keeping the first copy of each (instruction, input, output)"""
+    examples = []
+    seen = set()
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            example = json.loads(line)
+            content = json.dumps([example.get(field, "").strip() for field in ("instruction", "input", "output")])
+            key = hashlib.sha256(content.encode()).hexdigest()
+            if key not in seen:
+                seen.add(key)
+                examples.append({"instruction": example["instruction"], "output": example["output"]})
+    return examples
+
+
+def fingerprint(tokenizer, source):
+    """Identifies an artifact by everything that decides its contents"""
+    vocab = tokenizer.backend_tokenizer.to_str() if tokenizer.is_fast else json.dumps(tokenizer.get_vocab(), sort_keys=True)
+    return hashlib.sha256(json.dumps({
+        "version": ARTIFACT_VERSION,
+        "tokenizer": tokenizer.name_or_path,
+        "vocab": hashlib.sha256(vocab.encode()).hexdigest(),
+        "prompt_template": PROMPT_TEMPLATE,
+        "answer_template": ANSWER_TEMPLATE,
+        "max_length": MAX_LENGTH,
+        "source": file_sha256(source),
+    }, sort_keys=True).encode()).hexdigest()
+
+
+def tokenize(tokenizer, examples):
+    """Tokenizes without padding; labels are -100 over the prompt so only the answer is learned"""
+    prompts = [PROMPT_TEMPLATE.format(instruction=example["instruction"]) for example in examples]
+    texts = [prompt + ANSWER_TEMPLATE.format(output=example["output"]) for prompt, example in zip(prompts, examples)]
+
+    result = tokenizer(texts, truncation=True, max_length=MAX_LENGTH)
+    prompt_lengths = [len(ids) for ids in tokenizer(prompts)["input_ids"]]
+    result["labels"] = [
+        [-100] * min(n, len(ids)) + ids[n:]
+        for ids, n in zip(result["input_ids"], prompt_lengths)
+    ]
+    return Dataset.from_dict(dict(result))
+
+
+def build(tokenizer, source=SOURCE, output=OUTPUT_DIR):
+    examples = read_examples(source)
+    print(f"Tokenizing {len(examples)} unique examples from {source}...")
+    dataset = tokenize(tokenizer, examples)
+
+    # Write next to the target and swap in, so a crash never leaves a half-written artifact behind
+    staging = output + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    dataset.save_to_disk(staging)
+    with open(os.path.join(staging, "fingerprint.json"), "w") as f:
+        json.dump({"fingerprint": fingerprint(tokenizer, source), "examples": len(dataset)}, f)
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(staging, output)
+    print(f"✅ Saved tokenized dataset to {output}")
+    return load_from_disk(output)
+
+
+def load_or_build(tokenizer, source=SOURCE, output=OUTPUT_DIR):
+    """Memory-maps the tokenized artifact when it matches the tokenizer, template and source; rebuilds otherwise"""
+    try:
+        with open(os.path.join(output, "fingerprint.json")) as f:
+            stored = json.load(f)["fingerprint"]
+    except (OSError, ValueError, KeyError):
+        stored = None
+
+    if stored == fingerprint(tokenizer, source):
+        print(f"Using tokenized dataset {output}")
+        return load_from_disk(output)
+    return build(tokenizer, source, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the tokenized training dataset")
+    parser.add_argument("--source", default=SOURCE)
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the artifact is up to date")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"❌ No dataset at {args.source}. Run download_dataset.py first")
+        exit(1)
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    dataset = build(tokenizer, args.source, args.output) if args.force \
+        else load_or_build(tokenizer, args.source, args.output)
+    print(f"{len(dataset)} examples ready for train.py")
@@ -0,0 +1,143 @@
+# check_quantization.py  →  Compare AGRO_QUANTIZE=int8 against fp32 on the bundled examples
+import argparse
+import copy
+import difflib
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+# Quantized kernels are CPU only, and the fp32 references must be loaded unquantized
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ.pop("AGRO_QUANTIZE", None)
+
+import torch
+from PIL import Image
+from peft import PeftModel
+
+import app_agro as agro
+
+parser = argparse.ArgumentParser(description="Check int8 CPU inference against fp32 outputs")
+parser.add_argument("--modalities", default="text,image,voice")
+parser.add_argument("--samples", type=int, default=5, help="questions from data/agro_sample.json to compare")
+parser.add_argument("--max-new-tokens", type=int, default=128)
+parser.add_argument("--min-similarity", type=float, default=0.6,
+                    help="fail when the mean fp32/int8 text similarity drops below this")
+args = parser.parse_args()
+modalities = args.modalities.split(",")
+
+
+def size_mb(model):
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / 1024 / 1024
+
+
+def similarity(a, b):
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def timed(fn, *fn_args):
+    started = time.perf_counter()
+    result = fn(*fn_args)
+    return result, time.perf_counter() - started
+
+
+def report(name, fp32_model, int8_model, pairs, fp32_time, int8_time):
+    scores = [similarity(a, b) for a, b in pairs]
+    print(f"\n{name}")
+    print(f"  size:       {size_mb(fp32_model):8.1f} MB fp32 → {size_mb(int8_model):8.1f} MB int8")
+    print(f"  time:       {fp32_time:8.2f} s fp32 → {int8_time:8.2f} s int8 ({fp32_time / int8_time:.2f}x)")
+    print(f"  similarity: {sum(scores) / len(scores):.3f} mean, {min(scores):.3f} worst")
+    return {
+        "fp32_mb": size_mb(fp32_model),
+        "int8_mb": size_mb(int8_model),
+        "speedup": fp32_time / int8_time,
+        "similarity": sum(scores) / len(scores),
+    }
+
+
+print("=" * 60)
+print("🌾 INT8 QUANTIZATION CHECK")
+print("=" * 60)
+print(f"torch threads: {torch.get_num_threads()}, engine: {torch.backends.quantized.engine}")
+
+results = {}
+
+if "text" in modalities:
+    with open("data/agro_sample.json") as f:
+        questions = [example["instruction"] for example in json.load(f)][:args.samples]
+
+    model, tokenizer = agro.load_llm()
+    quantized = copy.deepcopy(model)
+    if isinstance(quantized, PeftModel):
+        quantized = quantized.merge_and_unload()
+    quantized = agro.quantize_int8(quantized).eval()
+
+    def answer_all(llm_model):
+        answers, generated = [], 0
+        for question in questions:
+            inputs = tokenizer(agro.build_prompt(question), return_tensors="pt")
+            with torch.no_grad():
+                output = llm_model.generate(**inputs, max_new_tokens=args.max_new_tokens, do_sample=False,
+                                            repetition_penalty=1.2, pad_token_id=tokenizer.pad_token_id)
+            new_tokens = output[0, inputs["input_ids"].shape[1]:]
+            generated += len(new_tokens)
+            answers.append(tokenizer.decode(new_tokens, skip_special_tokens=True).strip())
+        return answers, generated
+
+    (fp32_answers, fp32_tokens), fp32_time = timed(answer_all, model)
+    (int8_answers, int8_tokens), int8_time = timed(answer_all, quantized)
+    results["text"] = report("TinyLlama + agro-expert", model, quantized,
+                             list(zip(fp32_answers, int8_answers)), fp32_time, int8_time)
+    results["text"]["tokens_per_sec"] = {"fp32": fp32_tokens / fp32_time, "int8": int8_tokens / int8_time}
+    print(f"  tokens/sec: {fp32_tokens / fp32_time:8.1f} fp32 → {int8_tokens / int8_time:8.1f} int8")
+    del model, quantized
+
+if "image" in modalities:
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob("agro_images/*"))]
+    processor, model = agro.load_blip()
+    quantized = agro.quantize_int8(copy.deepcopy(model)).eval()
+
+    def caption_all(blip_model):
+        inputs = processor(images, [agro.CAPTION_PROMPT] * len(images), return_tensors="pt")
+        with torch.no_grad():
+            out = blip_model.generate(**inputs, max_new_tokens=60)
+        return processor.batch_decode(out, skip_special_tokens=True)
+
+    fp32_captions, fp32_time = timed(caption_all, model)
+    int8_captions, int8_time = timed(caption_all, quantized)
+    for fp32_caption, int8_caption in zip(fp32_captions, int8_captions):
+        print(f"  fp32: {fp32_caption}\n  int8: {int8_caption}")
+    results["image"] = report("BLIP", model, quantized, list(zip(fp32_captions, int8_captions)), fp32_time, int8_time)
+    del model, quantized
+
+if "voice" in modalities:
+    recordings = []
+    for path in sorted(glob.glob("agro_recordings/*")):
+        with open(path, "rb") as f:
+            recordings.append(agro.decode_audio(f.read()))
+    model = agro.load_whisper()
+    quantized = agro.quantize_int8(copy.deepcopy(model)).eval()
+
+    def transcribe_all(whisper_model):
+        return [whisper_model.transcribe(audio, fp16=False)["text"].strip() for audio in recordings]
+
+    fp32_texts, fp32_time = timed(transcribe_all, model)
+    int8_texts, int8_time = timed(transcribe_all, quantized)
+    for fp32_text, int8_text in zip(fp32_texts, int8_texts):
+        print(f"  fp32: {fp32_text}\n  int8: {int8_text}")
+    results["voice"] = report("Whisper", model, quantized, list(zip(fp32_texts, int8_texts)), fp32_time, int8_time)
+    del model, quantized
+
+print("\n" + json.dumps(results, indent=2))
+
+failed = [name for name, result in results.items() if result["similarity"] < args.min_similarity]
+if failed:
+    print(f"\n❌ int8 outputs drifted too far from fp32 for: {', '.join(failed)}")
+    sys.exit(1)
+
+print(f"\n✅ int8 outputs within {args.min_similarity} similarity of fp32")
+print("Serve with AGRO_QUANTIZE=int8")
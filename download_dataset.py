@@ -90,21 +90,20 @@ agro_examples = [
     }
 ]
 
-# Add examples multiple times for better training
-for _ in range(3):  # Repeat 3 times
-    for ex in agro_examples:
-        formatted.append({
-            "instruction": f"{SYSTEM}\n\nFarmer's question: {ex['q']}",
-            "input": "",
-            "output": ex['a']
-        })
-
-        # Also add without system prompt
-        formatted.append({
-            "instruction": ex['q'],
-            "input": "",
-            "output": ex['a']
-        })
+# Each example once; train.py runs 3x the epochs (9) to make up for the dropped duplicate rows
+for ex in agro_examples:
+    formatted.append({
+        "instruction": f"{SYSTEM}\n\nFarmer's question: {ex['q']}",
+        "input": "",
+        "output": ex['a']
+    })
+
+    # Also add without system prompt
+    formatted.append({
+        "instruction": ex['q'],
+        "input": "",
+        "output": ex['a']
+    })
 
 print(f"   ✅ Created {len(formatted)} agricultural examples\n")
 
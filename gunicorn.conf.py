@@ -0,0 +1,37 @@
+# gunicorn.conf.py  →  Load the models once in the master and share them copy-on-write with every worker
+import os
+
+# Lets the master ask whether there is a GPU without initializing CUDA, which forked workers could not use
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+
+import torch  # noqa: E402
+
+# Must be set before app_agro is imported (here, and by preload_app in the master). CUDA cannot be
+# re-initialized in a forked worker, so on GPU hosts each worker loads its own models after the fork.
+if torch.cuda.is_available():
+    print("CUDA available: not preloading models in the master; each worker loads its own")
+    # Nor warming up there; post_fork warms up each worker
+    os.environ["AGRO_WARMUP"] = "0"
+else:
+    os.environ["AGRO_PRELOAD"] = "1"
+
+import app_agro  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7860')}"
+# /jobs keeps its queue and results in one SQLite file (AGRO_JOB_DB), so a job submitted to one
+# worker can be polled through any other
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# Requests wait on the batch schedulers, so each worker serves several at once. Admission control
+# (AGRO_MAX_ACTIVE_REQUESTS + AGRO_MAX_QUEUED_REQUESTS) bounds the work per worker; threads bound how
+# many requests reach it, so there must be more of them or overload queues in gunicorn's backlog
+# instead of being shed with a 503. The spare threads send those 503s and answer /healthz and /jobs.
+worker_class = "gthread"
+threads = int(os.environ.get("AGRO_WORKER_THREADS",
+                             app_agro.MAX_ACTIVE_REQUESTS + app_agro.MAX_QUEUED_REQUESTS + 8))
+preload_app = True
+# Generation and transcription can take minutes on CPU
+timeout = int(os.environ.get("AGRO_WORKER_TIMEOUT", 300))
+
+
+def post_fork(server, worker):
+    app_agro.configure_worker(workers)
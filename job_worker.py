@@ -0,0 +1,17 @@
+# job_worker.py  →  Model worker process: runs /jobs requests from the job database the web processes fill
+import argparse
+
+import app_agro as agro
+
+parser = argparse.ArgumentParser(description="Drain the /jobs queue with a model worker process")
+parser.add_argument("--threads", type=int, default=max(agro.JOB_WORKERS, 1), help="jobs run at once")
+args = parser.parse_args()
+
+if __name__ == "__main__":
+    modalities = agro.app.config["AGRO_MODALITIES"]
+    print(f"Job worker for {agro.JOB_DB_PATH}: warming up {', '.join(modalities)}...")
+    agro.warm_up(modalities)
+    agro.job_queue.workers = args.threads
+    print(f"✅ Running jobs on {args.threads} threads")
+    for thread in agro.job_queue.start():
+        thread.join()
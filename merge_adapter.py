@@ -0,0 +1,51 @@
+# merge_adapter.py  →  Bake the agro-expert LoRA into TinyLlama once for fast server starts
+import argparse
+import os
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from peft import PeftModel
+
+BASE_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+ADAPTER_DIR = "models/agro-expert"
+OUTPUT_DIR = "models/agro-expert-merged"
+
+DTYPES = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+parser = argparse.ArgumentParser(description="Merge the LoRA adapter into the base weights")
+parser.add_argument("--adapter", default=ADAPTER_DIR)
+parser.add_argument("--output", default=OUTPUT_DIR)
+parser.add_argument("--dtype", choices=DTYPES, default="fp32",
+                    help="dtype of the saved weights (fp32 for CPU nodes, fp16/bf16 to halve size)")
+args = parser.parse_args()
+
+if not os.path.exists(os.path.join(args.adapter, "adapter_config.json")):
+    print(f"❌ No adapter in {args.adapter}. Run train.py first")
+    exit(1)
+
+print("=" * 60)
+print("🌾 MERGING AGROEXPERT ADAPTER")
+print("=" * 60 + "\n")
+
+# Merge in fp32 so the LoRA delta is not rounded before it is added
+print(f"Loading {BASE_MODEL}...")
+base_model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.float32)
+
+print(f"Loading adapter {args.adapter}...")
+model = PeftModel.from_pretrained(base_model, args.adapter)
+
+print("Merging...")
+model = model.merge_and_unload()
+model = model.to(DTYPES[args.dtype])
+
+print(f"\n💾 Saving {args.dtype} checkpoint...")
+# One shard → a single model.safetensors the server can memory-map
+model.save_pretrained(args.output, safe_serialization=True, max_shard_size="100GB")
+AutoTokenizer.from_pretrained(BASE_MODEL).save_pretrained(args.output)
+
+print(f"✅ Saved to {args.output}")
+print(f"\nStart the server with AGRO_MERGED_MODEL={args.output}")
@@ -1,26 +1,38 @@
 # launch.py  →  Fixed to use .venv Python (port 7860)
+import json
+import os
 import subprocess
 import time
 import sys
-import socket
+import urllib.error
+import urllib.request
 
 PORT = 7860
 SCRIPT = "app_agro.py"
 
-def check_port(port, max_wait=30):
-    """Wait until Flask is actually listening"""
-    print(f"Waiting for Flask to start on port {port}...")
+def wait_until_ready(port, process, max_wait=900):
+    """Wait until /readyz says every model has loaded and served its warm-up request"""
+    print(f"Waiting for AgroExpert Vision to warm up on port {port}...")
     start = time.time()
     while time.time() - start < max_wait:
+        if process.poll() is not None:
+            print(f"Server exited with code {process.returncode}")
+            return False
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1)
-            result = sock.connect_ex(('127.0.0.1', port))
-            sock.close()
-            if result == 0:
-                print(f"✓ Flask is ready on port {port}!")
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=2):
+                print(f"✓ AgroExpert Vision is ready on port {port}! ({time.time() - start:.0f}s)")
                 return True
-        except:
+        except urllib.error.HTTPError as e:
+            # 503 while warming up; a failed warm-up will not recover on its own
+            try:
+                status = json.loads(e.read())
+            except ValueError:
+                status = {}
+            if status.get("status") == "failed":
+                print(f"Warm-up failed: {status.get('error')}")
+                return False
+        except OSError:
+            # Not listening yet
             pass
         time.sleep(1)
     return False
@@ -28,13 +40,14 @@ def check_port(port, max_wait=30):
 print(f"Starting AgroExpert Vision on http://127.0.0.1:{PORT}")
 
 # Use sys.executable to run with the SAME Python (inside .venv)
+# AGRO_WARMUP=1 loads and exercises every model before /readyz reports ready
 flask_process = subprocess.Popen([
     sys.executable, SCRIPT  # ← Fixed: uses your .venv Python
-])
+], env={**os.environ, "AGRO_WARMUP": "1"})
 
-# Wait for Flask to actually be ready
-if not check_port(PORT):
-    print(f"\n❌ Flask didn't start on port {PORT}!")
+# Wait until the first request will be as fast as any other
+if not wait_until_ready(PORT, flask_process):
+    print(f"\n❌ AgroExpert Vision didn't become ready on port {PORT}!")
     flask_process.terminate()
     sys.exit(1)
 
@@ -1,10 +1,16 @@
+import argparse
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer, \
-    DataCollatorForLanguageModeling
+    DataCollatorForSeq2Seq, DataCollatorWithFlattening
 from peft import LoraConfig, get_peft_model, TaskType
-from datasets import load_dataset
+from build_dataset import load_or_build
 import os
 
+parser = argparse.ArgumentParser(description="Train the agro-expert LoRA adapter")
+parser.add_argument("--packing", action="store_true",
+                    help="concatenate each batch into one padding-free row (needs flash-attn)")
+args = parser.parse_args()
+
 print("=" * 60)
 print("🌾 AGROEXPERT MODEL TRAINING")
 print("=" * 60 + "\n")
@@ -15,7 +21,7 @@ if not torch.cuda.is_available():
     exit(1)
 
 if not os.path.exists("data/agro_train.jsonl"):
-    print("❌ No dataset. Run download_agro_dataset.py first")
+    print("❌ No dataset. Run download_dataset.py first")
     exit(1)
 
 MODEL_NAME = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
@@ -33,6 +39,8 @@ model = AutoModelForCausalLM.from_pretrained(
     MODEL_NAME,
     torch_dtype=torch.float16,
     device_map="cuda",
+    # Packed rows hold several examples; flash-attn's varlen kernels keep them from attending to each other
+    attn_implementation="flash_attention_2" if args.packing else None,
 )
 
 model.gradient_checkpointing_enable()
@@ -51,65 +59,45 @@ lora_config = LoraConfig(
 model = get_peft_model(model, lora_config)
 model.print_trainable_parameters()
 
-# Load dataset
+# Load dataset (tokenized once by build_dataset.py and memory-mapped from disk)
 print("\nLoading dataset...")
-dataset = load_dataset("json", data_files="data/agro_train.jsonl", split="train")
-print(f"Loaded {len(dataset)} examples\n")
-
-
-# Format for TinyLlama
-def format_chat(example):
-    inst = example['instruction']
-    out = example['output']
-
-    text = f"""<|system|>
-You are an agricultural expert assistant helping farmers.</s>
-<|user|>
-{inst}</s>
-<|assistant|>
-{out}</s>"""
-
-    return {"text": text}
-
-
-dataset = dataset.map(format_chat)
-
-
-# Tokenize
-def tokenize(examples):
-    result = tokenizer(
-        examples["text"],
-        truncation=True,
-        max_length=512,
-        padding="max_length",
-    )
-    result["labels"] = result["input_ids"].copy()
-    return result
-
-
-print("Tokenizing...")
-tokenized = dataset.map(tokenize, batched=True, remove_columns=dataset.column_names)
+tokenized = load_or_build(tokenizer)
+print(f"Loaded {len(tokenized)} examples")
+lengths = [len(ids) for ids in tokenized["input_ids"]]
+print(f"Tokens per example: mean {sum(lengths) / len(lengths):.0f}, max {max(lengths)} (was padded to 512)\n")
+
+if args.packing:
+    # Position ids restart at each example, which is what marks the boundaries inside a packed row
+    data_collator = DataCollatorWithFlattening()
+else:
+    # Pads each batch only to its longest example; padded label positions are ignored by the loss
+    data_collator = DataCollatorForSeq2Seq(tokenizer, padding=True, label_pad_token_id=-100, pad_to_multiple_of=8)
 
 # Training
 training_args = TrainingArguments(
     output_dir=OUTPUT_DIR,
-    num_train_epochs=3,
-    per_device_train_batch_size=2,
-    gradient_accumulation_steps=4,
+    # The dataset holds each example once (it used to repeat them 3x), so 3x the epochs keeps the same passes
+    num_train_epochs=9,
+    # Same 8 examples per optimizer step either way; packed, they share one padding-free row per step
+    per_device_train_batch_size=8 if args.packing else 2,
+    gradient_accumulation_steps=1 if args.packing else 4,
     learning_rate=3e-4,
     fp16=True,
     logging_steps=10,
     save_strategy="epoch",
     save_total_limit=1,
-    warmup_steps=20,
+    # A fixed step count would outlast the whole run on the small deduplicated dataset
+    warmup_ratio=0.1,
     report_to="none",
+    # Batches examples of similar length together so dynamic padding stays short
+    group_by_length=not args.packing,
 )
 
 trainer = Trainer(
     model=model,
     args=training_args,
     train_dataset=tokenized,
-    data_collator=DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False),
+    data_collator=data_collator,
 )
 
 print("🚀 Training (10-15 minutes)...\n")